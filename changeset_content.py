@@ -0,0 +1,137 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone, timedelta
+from pathlib import Path
+from urllib.request import urlopen, Request
+import xml.etree.ElementTree as ET
+
+from publish import atomic_write_json
+
+# Optional enrichment: what a changeset actually did, by action and element type, from
+# /api/0.6/changeset/<id>/download. Results are cached on disk per changeset ID (a closed
+# changeset never changes), so each one is downloaded at most once.
+#
+# Cache layout: <cache_dir>/<id // SHARD_SIZE>/<id>.json
+
+DOWNLOAD_URL = "https://opengeofiction.net/api/0.6/changeset/{id}/download"
+USER_AGENT = "ogf-stats-script"
+SHARD_SIZE = 10000
+WORKERS = 4
+BUDGET = 200  # downloads per cycle
+OPEN_MAX_AGE = timedelta(hours=25)  # the API force-closes changesets after 24h
+
+ACTIONS = ("create", "modify", "delete")
+TYPES = ("node", "way", "relation")
+
+
+def empty_counts():
+    return {a: {t: 0 for t in TYPES} for a in ACTIONS}
+
+
+def parse_osmchange(stream):
+    """Per-action, per-type counts from an osmChange document, parsed incrementally."""
+    counts = empty_counts()
+    action = None
+    context = ET.iterparse(stream, events=("start", "end"))
+    _, root = next(context)
+    for event, el in context:
+        if event == "start":
+            if el.tag in ACTIONS:
+                action = el.tag
+            continue
+        if el.tag in TYPES and action:
+            counts[action][el.tag] += 1
+            el.clear()
+        elif el.tag in ACTIONS:
+            action = None
+            root.clear()
+    return counts
+
+
+def download_counts(cid):
+    req = Request(DOWNLOAD_URL.format(id=cid), headers={"User-Agent": USER_AGENT})
+    with urlopen(req, timeout=60) as resp:
+        return parse_osmchange(resp)
+
+
+class ContentCache:
+    def __init__(self, cache_dir):
+        self.dir = Path(cache_dir)
+
+    def _path(self, cid):
+        cid = int(cid)
+        return self.dir / str(cid // SHARD_SIZE) / f"{cid}.json"
+
+    def get(self, cid):
+        p = self._path(cid)
+        if not p.exists():
+            return None
+        try:
+            return json.loads(p.read_text(encoding="utf-8"))
+        except Exception:
+            return None
+
+    def put(self, cid, counts):
+        atomic_write_json(self._path(cid), counts, separators=(",", ":"))
+
+
+def is_closed(entry, now):
+    if entry.get("closed_at"):
+        return True
+    created = entry.get("created_at")
+    if not created:
+        return False
+    return datetime.strptime(created, "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=timezone.utc) < now - OPEN_MAX_AGE
+
+
+def enrich(entries, cache, budget=BUDGET, workers=WORKERS, now=None):
+    """Sets entry["content"] on every closed entry that is cached or fits the download budget.
+    Returns the entries left without content (still open, over budget, or failed) so the
+    caller can retry them next cycle."""
+    now = now or datetime.now(timezone.utc)
+    todo, pending = [], []
+    for e in entries:
+        if e.get("content"):
+            continue
+        cached = cache.get(e["id"])
+        if cached is not None:
+            e["content"] = cached
+        elif is_closed(e, now) and len(todo) < budget:
+            todo.append(e)
+        else:
+            pending.append(e)
+
+    def fetch(e):
+        try:
+            return e, download_counts(e["id"])
+        except Exception as ex:
+            print(f"Content fetch error for changeset {e['id']}: {ex}")
+            return e, None
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for e, counts in pool.map(fetch, todo):
+            if counts is None:
+                pending.append(e)
+                continue
+            cache.put(e["id"], counts)
+            e["content"] = counts
+    return pending
+
+
+def add_counts(total, content):
+    for a in ACTIONS:
+        for t in TYPES:
+            total[a][t] += content.get(a, {}).get(t, 0)
+
+
+def summarize(entries):
+    """Sums the content counts of the enriched entries: ({action: {type: n}}, number enriched)."""
+    total = empty_counts()
+    n = 0
+    for e in entries:
+        c = e.get("content")
+        if not c:
+            continue
+        n += 1
+        add_counts(total, c)
+    return total, n
@@ -0,0 +1,136 @@
+import json
+import sys
+from pathlib import Path
+
+import day_archive
+from publish import atomic_write_json
+
+# Query index over the day cache (see day_archive.py).
+#
+#   <cache_dir>/index/catalog.json           {month: {start, end, min_id, max_id, count, size, mtime_ns}}
+#   <cache_dir>/index/postings/<month>.json  {uid: [block numbers in that month's archive]}
+#
+# A range query opens only the archives whose catalog range overlaps, and inside them
+# decompresses only the blocks whose footer range (and, with a uid, posting list) matches.
+# Day files not compacted yet (today's) are small and scanned directly.
+
+
+def index_dir(cache_dir):
+    return Path(cache_dir) / "index"
+
+
+def postings_path(cache_dir, month):
+    return index_dir(cache_dir) / "postings" / f"{month}.json"
+
+
+def load_catalog(cache_dir):
+    try:
+        return json.loads((index_dir(cache_dir) / "catalog.json").read_text(encoding="utf-8"))
+    except Exception:
+        return {}
+
+
+def index_archive(cache_dir, month):
+    """Builds the postings file for one month's archive and returns its catalog entry."""
+    path = day_archive.archive_path(cache_dir, month)
+    postings = {}
+    with day_archive.ArchiveReader(path) as r:
+        for n, b in enumerate(r.blocks):
+            for e in r.read_block(b):
+                blocks = postings.setdefault(str(e.get("uid")), [])
+                if not blocks or blocks[-1] != n:
+                    blocks.append(n)
+        blocks = r.blocks
+        entry = {
+            "start": blocks[0]["start"] if blocks else "",
+            "end": blocks[-1]["end"] if blocks else "",
+            "min_id": min((b["min_id"] for b in blocks), default=0),
+            "max_id": max((b["max_id"] for b in blocks), default=0),
+            "count": len(r),
+        }
+    st = path.stat()
+    entry["size"], entry["mtime_ns"] = st.st_size, st.st_mtime_ns
+    atomic_write_json(postings_path(cache_dir, month), postings, separators=(",", ":"))
+    return entry
+
+
+def refresh(cache_dir):
+    """Re-indexes archives that are new or changed since the catalog was written; drops removed ones."""
+    catalog = load_catalog(cache_dir)
+    archives = {p.stem: p for p in (Path(cache_dir) / "archive").glob("*.archive")}
+    changed = False
+    for month, path in sorted(archives.items()):
+        st = path.stat()
+        known = catalog.get(month)
+        if known and known.get("size") == st.st_size and known.get("mtime_ns") == st.st_mtime_ns:
+            continue
+        catalog[month] = index_archive(cache_dir, month)
+        changed = True
+    for month in [m for m in catalog if m not in archives]:
+        del catalog[month]
+        postings_path(cache_dir, month).unlink(missing_ok=True)
+        changed = True
+    if changed:
+        atomic_write_json(index_dir(cache_dir) / "catalog.json", catalog, indent=2)
+    return catalog
+
+
+def query(cache_dir, start=None, end=None, uid=None, min_id=None, max_id=None):
+    """Changesets created in [start, end) (ISO strings) with min_id <= id <= max_id, optionally by one uid.
+    Archived months stream in (created_at, id) order, then uncompacted day files."""
+    cache_dir = Path(cache_dir)
+    uid = str(uid) if uid is not None else None
+    for month, info in sorted(load_catalog(cache_dir).items()):
+        if not day_archive.block_overlaps(info, start, end, min_id, max_id):
+            continue
+        allowed = None
+        if uid is not None:
+            try:
+                allowed = set(json.loads(postings_path(cache_dir, month).read_text(encoding="utf-8")).get(uid, []))
+            except Exception:
+                allowed = None  # postings missing: fall back to the block ranges alone
+            if allowed is not None and not allowed:
+                continue
+        with day_archive.ArchiveReader(day_archive.archive_path(cache_dir, month)) as r:
+            for n, b in enumerate(r.blocks):
+                if allowed is not None and n not in allowed:
+                    continue
+                if not day_archive.block_overlaps(b, start, end, min_id, max_id):
+                    continue
+                for e in r.read_block(b):
+                    if (uid is None or str(e.get("uid")) == uid) and day_archive.matches(e, start, end, min_id, max_id):
+                        yield e
+
+    for p in sorted(cache_dir.glob("????-??-??.json*")):
+        day = p.name[:10]
+        if (start is not None and day < start[:10]) or (end is not None and day > end[:10]):
+            continue
+        for e in day_archive.read_day(p):
+            if (uid is None or str(e.get("uid")) == uid) and day_archive.matches(e, start, end, min_id, max_id):
+                yield e
+
+
+def main():
+    # python changeset_index.py <cache_dir> [--uid U] [--start ISO] [--end ISO] [--min-id N] [--max-id N]
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument("cache_dir")
+    parser.add_argument("--uid")
+    parser.add_argument("--start")
+    parser.add_argument("--end")
+    parser.add_argument("--min-id", type=int)
+    parser.add_argument("--max-id", type=int)
+    parser.add_argument("--refresh", action="store_true", help="Re-index changed archives first")
+    args = parser.parse_args()
+
+    if args.refresh:
+        refresh(args.cache_dir)
+    n = 0
+    for e in query(args.cache_dir, args.start, args.end, args.uid, args.min_id, args.max_id):
+        sys.stdout.write(json.dumps(e, ensure_ascii=False) + "\n")
+        n += 1
+    print(f"{n} changesets", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+import sqlite3
+import threading
+from datetime import datetime, timezone
+
+# SQLite storage for changesets and per-hour, per-user aggregates.
+# Leaderboards for any window become a GROUP BY over the small hourly_user table
+# instead of re-tallying every stored changeset. WAL mode lets readers (the HTTP
+# server threads) query while the updater writes.
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS changesets (
+    id INTEGER PRIMARY KEY,
+    uid TEXT NOT NULL,
+    user TEXT,
+    changes_count INTEGER NOT NULL DEFAULT 0,
+    created_at TEXT,
+    created_by TEXT,
+    hour INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_changesets_uid_created ON changesets(uid, created_at);
+CREATE INDEX IF NOT EXISTS idx_changesets_hour ON changesets(hour);
+
+CREATE TABLE IF NOT EXISTS hourly_user (
+    hour INTEGER NOT NULL,
+    uid TEXT NOT NULL,
+    user TEXT,
+    count INTEGER NOT NULL,
+    objects INTEGER NOT NULL,
+    PRIMARY KEY (hour, uid)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_hourly_user_uid ON hourly_user(uid, hour);
+
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL);
+INSERT OR IGNORE INTO meta (key, value) VALUES ('generation', 0);
+"""
+
+BUCKETS = {"hour": 1, "day": 24}
+
+
+def epoch_hour(dt: datetime) -> int:
+    return int(dt.replace(tzinfo=dt.tzinfo or timezone.utc).timestamp()) // 3600
+
+
+def hour_iso(hour: int) -> str:
+    return datetime.fromtimestamp(hour * 3600, timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def parse_ts(ts: str) -> datetime:
+    return datetime.fromisoformat(ts.replace("Z", "+00:00"))
+
+
+class ChangesetStore:
+    def __init__(self, path):
+        self.path = str(path)
+        self._local = threading.local()
+        with self.conn() as c:
+            c.execute("PRAGMA journal_mode=WAL")
+            c.executescript(SCHEMA)
+
+    def conn(self) -> sqlite3.Connection:
+        # One connection per thread; sqlite3 connections aren't shareable across threads
+        c = getattr(self._local, "conn", None)
+        if c is None:
+            c = sqlite3.connect(self.path, timeout=30)
+            c.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = c
+        return c
+
+    def add(self, entries, fallback_hour: datetime = None) -> int:
+        """Inserts changesets (dicts shaped like fetch_recent_changesets output). Returns how many were new."""
+        c = self.conn()
+        added = 0
+        with c:
+            for e in entries:
+                ts = e.get("created_at")
+                hour = epoch_hour(parse_ts(ts)) if ts else epoch_hour(fallback_hour)
+                cur = c.execute(
+                    "INSERT OR IGNORE INTO changesets (id, uid, user, changes_count, created_at, created_by, hour) VALUES (?,?,?,?,?,?,?)",
+                    (int(e["id"]), str(e["uid"]), e.get("user"), int(e.get("changes_count") or 0), ts, e.get("created_by"), hour))
+                if cur.rowcount != 1:
+                    continue
+                added += 1
+                c.execute(
+                    "INSERT INTO hourly_user (hour, uid, user, count, objects) VALUES (?,?,?,1,?) "
+                    "ON CONFLICT(hour, uid) DO UPDATE SET count = count + 1, objects = objects + excluded.objects, user = excluded.user",
+                    (hour, str(e["uid"]), e.get("user"), int(e.get("changes_count") or 0)))
+            if added:
+                c.execute("UPDATE meta SET value = value + 1 WHERE key = 'generation'")
+        return added
+
+    def generation(self) -> int:
+        """Bumped by every add() that stored something; lets readers in other processes invalidate caches."""
+        return self.conn().execute("SELECT value FROM meta WHERE key = 'generation'").fetchone()[0]
+
+    def leaderboard(self, start: datetime, end: datetime, limit=None):
+        """Users ranked by changesets then objects for created_at hours in [start, end). limit=None returns
+        every user; any other limit is at least 1 (SQLite would read 0 as no rows and -1 as unlimited)."""
+        sql = ("SELECT MAX(user), uid, SUM(count) AS n, SUM(objects) AS o FROM hourly_user "
+               "WHERE hour >= ? AND hour < ? GROUP BY uid ORDER BY n DESC, o DESC")
+        params = [epoch_hour(start), epoch_hour(end)]
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(max(1, int(limit)))
+        rows = self.conn().execute(sql, params).fetchall()
+        return [{"user": u, "uid": uid, "count": n, "objects": o} for u, uid, n, o in rows]
+
+    def user_series(self, uid, start: datetime, end: datetime, bucket="day"):
+        size = BUCKETS[bucket]
+        rows = self.conn().execute(
+            "SELECT hour / ? * ? AS b, SUM(count), SUM(objects) FROM hourly_user "
+            "WHERE uid = ? AND hour >= ? AND hour < ? GROUP BY b ORDER BY b",
+            (size, size, str(uid), epoch_hour(start), epoch_hour(end))).fetchall()
+        return [{"timestamp": hour_iso(b), "count": n, "objects": o} for b, n, o in rows]
+
+    def totals(self, start: datetime, end: datetime, bucket="day"):
+        size = BUCKETS[bucket]
+        rows = self.conn().execute(
+            "SELECT hour / ? * ? AS b, SUM(count), SUM(objects), COUNT(DISTINCT uid) FROM hourly_user "
+            "WHERE hour >= ? AND hour < ? GROUP BY b ORDER BY b",
+            (size, size, epoch_hour(start), epoch_hour(end))).fetchall()
+        return [{"timestamp": hour_iso(b), "count": n, "objects": o, "mappers": m} for b, n, o, m in rows]
+
+    def editor_share(self, start: datetime, end: datetime):
+        rows = self.conn().execute(
+            "SELECT COALESCE(NULLIF(created_by, ''), 'unknown'), COUNT(*), SUM(changes_count) FROM changesets "
+            "WHERE hour >= ? AND hour < ? GROUP BY 1 ORDER BY 2 DESC",
+            (epoch_hour(start), epoch_hour(end))).fetchall()
+        total = sum(r[1] for r in rows) or 1
+        return [{"editor": ed, "count": n, "objects": o, "share": round(n / total, 4)} for ed, n, o in rows]
+
+    def close(self):
+        c = getattr(self._local, "conn", None)
+        if c is not None:
+            c.close()
+            self._local.conn = None
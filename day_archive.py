@@ -0,0 +1,210 @@
+import gzip
+import json
+import os
+import struct
+import sys
+from pathlib import Path
+
+from publish import atomic_write_bytes
+
+# Storage for the per-day changeset cache (ogfstats CACHE_DIR).
+#
+# The current day is <cache_dir>/<YYYY-MM-DD>.jsonl, appended to each cycle. Once a day is
+# over, compact() folds it into <cache_dir>/archive/<YYYY-MM>.archive:
+#
+#   [gzip member][gzip member]...[footer JSON][footer length <Q][MAGIC]
+#
+# Each gzip member is a block of up to BLOCK_ENTRIES changesets as JSON lines, sorted by
+# (created_at, id). The footer lists every block's byte offset and length with its ID and
+# created_at range, so a reader can seek straight to the blocks a query needs and
+# decompress only those.
+
+MAGIC = b"OGFARC01"
+TAIL = struct.Struct("<Q8s")
+BLOCK_ENTRIES = 512
+
+
+def day_path(cache_dir, day):
+    return Path(cache_dir) / f"{day}.jsonl"
+
+
+def archive_path(cache_dir, month):
+    return Path(cache_dir) / "archive" / f"{month}.archive"
+
+
+def sort_key(e):
+    return (e.get("created_at") or "", int(e["id"]))
+
+
+def _line(e):
+    return json.dumps(e, separators=(",", ":"), ensure_ascii=False).encode("utf-8") + b"\n"
+
+
+def append_day(cache_dir, day, entries):
+    """Appends entries to the day's .jsonl file; nothing already written is read or rewritten."""
+    path = day_path(cache_dir, day)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "ab") as f:
+        f.write(b"".join(_line(e) for e in entries))
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def read_day(path, strict=False):
+    """Entries of a day file: .jsonl (skipping a torn last line) or a legacy pretty-printed .json array.
+    An unreadable legacy file reads as empty unless `strict`, which raises instead."""
+    path = Path(path)
+    if path.suffix == ".json":
+        try:
+            return json.loads(path.read_text(encoding="utf-8"))
+        except Exception:
+            if strict:
+                raise
+            return []
+    out = []
+    with open(path, "rb") as f:
+        for line in f:
+            try:
+                out.append(json.loads(line))
+            except ValueError:
+                continue
+    return out
+
+
+def write_archive(path, entries):
+    """Writes entries (already sorted by sort_key) as a block archive, atomically."""
+    parts, blocks, offset = [], [], 0
+    for i in range(0, len(entries), BLOCK_ENTRIES):
+        block = entries[i:i + BLOCK_ENTRIES]
+        data = gzip.compress(b"".join(_line(e) for e in block), compresslevel=9, mtime=0)
+        ids = [int(e["id"]) for e in block]
+        blocks.append({"offset": offset, "length": len(data), "count": len(block),
+                       "min_id": min(ids), "max_id": max(ids),
+                       "start": block[0].get("created_at") or "", "end": block[-1].get("created_at") or ""})
+        parts.append(data)
+        offset += len(data)
+    footer = json.dumps({"version": 1, "count": len(entries), "blocks": blocks}, separators=(",", ":")).encode("utf-8")
+    atomic_write_bytes(path, b"".join(parts) + footer + TAIL.pack(len(footer), MAGIC))
+
+
+def block_overlaps(b, start=None, end=None, min_id=None, max_id=None):
+    """Whether a block (or any {start, end, min_id, max_id} range) can hold matching changesets."""
+    if start is not None and b["end"] < start: return False
+    if end is not None and b["start"] >= end: return False
+    if min_id is not None and b["max_id"] < min_id: return False
+    if max_id is not None and b["min_id"] > max_id: return False
+    return True
+
+
+def matches(e, start=None, end=None, min_id=None, max_id=None):
+    ts = e.get("created_at") or ""
+    if start is not None and ts < start: return False
+    if end is not None and ts >= end: return False
+    if min_id is not None and int(e["id"]) < min_id: return False
+    if max_id is not None and int(e["id"]) > max_id: return False
+    return True
+
+
+class ArchiveReader:
+    def __init__(self, path):
+        self.path = Path(path)
+        self.file = open(self.path, "rb")
+        self.file.seek(0, os.SEEK_END)
+        size = self.file.tell()
+        if size < TAIL.size:
+            self.close()
+            raise ValueError(f"{self.path}: too short to be an archive")
+        self.file.seek(size - TAIL.size)
+        footer_len, magic = TAIL.unpack(self.file.read(TAIL.size))
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f"{self.path}: not a changeset archive")
+        self.file.seek(size - TAIL.size - footer_len)
+        footer = json.loads(self.file.read(footer_len))
+        self.blocks = footer["blocks"]
+        self.count = footer["count"]
+
+    def __len__(self):
+        return self.count
+
+    def select(self, start=None, end=None, min_id=None, max_id=None):
+        """Blocks that may hold changesets created in [start, end) with min_id <= id <= max_id."""
+        return [b for b in self.blocks if block_overlaps(b, start, end, min_id, max_id)]
+
+    def read_block(self, b):
+        self.file.seek(b["offset"])
+        raw = gzip.decompress(self.file.read(b["length"]))
+        return [json.loads(line) for line in raw.splitlines() if line]
+
+    def iter(self, start=None, end=None, min_id=None, max_id=None):
+        """Streams matching changesets in (created_at, id) order, one block in memory at a time."""
+        for b in self.select(start, end, min_id, max_id):
+            for e in self.read_block(b):
+                if matches(e, start, end, min_id, max_id):
+                    yield e
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def compact(cache_dir, today):
+    """Folds every day file older than `today` (YYYY-MM-DD) into its month's archive, merging with
+    what the archive already holds, then removes the day files. Returns the months rewritten."""
+    cache_dir = Path(cache_dir)
+    by_month = {}
+    for p in cache_dir.glob("????-??-??.json*"):
+        day = p.name[:10]
+        if p.suffix in (".json", ".jsonl") and day < today:
+            by_month.setdefault(day[:7], []).append(p)
+
+    for month, paths in sorted(by_month.items()):
+        arc = archive_path(cache_dir, month)
+        merged = {}
+        if arc.exists():
+            with ArchiveReader(arc) as r:
+                for e in r.iter():
+                    merged[str(e["id"])] = e
+        for p in sorted(paths):
+            for e in read_day(p):
+                merged[str(e["id"])] = e
+        write_archive(arc, sorted(merged.values(), key=sort_key))
+        for p in paths:
+            p.unlink()
+        print(f"✓ Compacted {len(paths)} day files into {arc.name} ({len(merged)} changesets)")
+    return sorted(by_month)
+
+
+def main():
+    # python day_archive.py compact <cache_dir> [today]
+    # python day_archive.py cat <file.archive> [--start ISO] [--end ISO] [--min-id N] [--max-id N]
+    import argparse
+    from datetime import datetime, timezone
+    parser = argparse.ArgumentParser()
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("compact")
+    p.add_argument("cache_dir")
+    p.add_argument("today", nargs="?", default=datetime.now(timezone.utc).strftime("%Y-%m-%d"))
+    p = sub.add_parser("cat")
+    p.add_argument("archive")
+    p.add_argument("--start")
+    p.add_argument("--end")
+    p.add_argument("--min-id", type=int)
+    p.add_argument("--max-id", type=int)
+    args = parser.parse_args()
+
+    if args.cmd == "compact":
+        compact(args.cache_dir, args.today)
+    else:
+        with ArchiveReader(args.archive) as r:
+            for e in r.iter(args.start, args.end, args.min_id, args.max_id):
+                sys.stdout.write(json.dumps(e, ensure_ascii=False) + "\n")
+
+
+if __name__ == "__main__":
+    main()
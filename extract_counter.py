@@ -0,0 +1,204 @@
+import bisect
+import mmap
+import tempfile
+from array import array
+import xml.etree.ElementTree as ET
+
+import territory_index
+
+# Offline alternative to ts.run_overpass: one streaming pass over a local .osm / .osm.pbf
+# extract, counting elements per territory with the same rules as the Overpass query
+# (node in area; way with any node in area; relation with any node/way member in area).
+# Like Overpass areas, an element inside nested or overlapping territories counts in each.
+#
+# Memory: the ids of nodes and ways inside territories are needed later (ways look up their
+# nodes, relations their members), so they go to temporary files as sorted (id, slot) columns
+# and are binary-searched through mmap. What stays in memory is one write buffer per map and
+# the per-territory counts; the id maps themselves live on disk and in the page cache.
+# Planet files and osmium output list ids in ascending order. An extract that doesn't is
+# still counted correctly, but its maps are sorted in memory, so that case is O(elements in
+# territories).
+
+BUFFER = 1 << 16  # (id, slot) pairs buffered before a write
+
+
+class IdSlotMap:
+    """Append-only map from element id to the territory slots it's in, kept on disk."""
+
+    def __init__(self, directory=None):
+        self.ids_file = tempfile.TemporaryFile(dir=directory)
+        self.slots_file = tempfile.TemporaryFile(dir=directory)
+        self.buf_ids, self.buf_slots = array("q"), array("H")
+        self.count = 0
+        self.last = None
+        self.in_order = True
+        self._maps = None  # (ids mmap, slots mmap, ids view, slots view) while reading
+
+    def add(self, element_id, slot):
+        if self._maps is not None:
+            self._unmap()
+        if self.last is not None and element_id < self.last:
+            self.in_order = False
+        self.last = element_id
+        self.buf_ids.append(element_id)
+        self.buf_slots.append(slot)
+        self.count += 1
+        if len(self.buf_ids) >= BUFFER:
+            self._flush()
+
+    def _flush(self):
+        self.ids_file.seek(0, 2)
+        self.slots_file.seek(0, 2)
+        self.buf_ids.tofile(self.ids_file)
+        self.buf_slots.tofile(self.slots_file)
+        self.buf_ids, self.buf_slots = array("q"), array("H")
+
+    def _sort(self):
+        # Out-of-order input: one in-memory sort, then the files are rewritten in order
+        ids, slots = array("q"), array("H")
+        self.ids_file.seek(0)
+        self.slots_file.seek(0)
+        ids.frombytes(self.ids_file.read())
+        slots.frombytes(self.slots_file.read())
+        order = sorted(range(len(ids)), key=ids.__getitem__)
+        for f, col, typecode in ((self.ids_file, ids, "q"), (self.slots_file, slots, "H")):
+            f.seek(0)
+            f.truncate()
+            array(typecode, (col[i] for i in order)).tofile(f)
+        self.in_order = True
+
+    def _map(self):
+        self._flush()
+        if not self.in_order:
+            self._sort()
+        self.ids_file.flush()
+        self.slots_file.flush()
+        ids = mmap.mmap(self.ids_file.fileno(), 0, access=mmap.ACCESS_READ)
+        slots = mmap.mmap(self.slots_file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._maps = (ids, slots, memoryview(ids).cast("q"), memoryview(slots).cast("H"))
+
+    def _unmap(self):
+        ids, slots, ids_view, slots_view = self._maps
+        ids_view.release()
+        slots_view.release()
+        ids.close()
+        slots.close()
+        self._maps = None
+
+    def lookup(self, element_id):
+        """Set of slots `element_id` was added with (empty if none)."""
+        if not self.count:
+            return set()
+        if self._maps is None:
+            self._map()
+        _, _, ids, slots = self._maps
+        i = bisect.bisect_left(ids, element_id)
+        found = set()
+        while i < len(ids) and ids[i] == element_id:
+            found.add(slots[i])
+            i += 1
+        return found
+
+    def close(self):
+        if self._maps is not None:
+            self._unmap()
+        self.ids_file.close()
+        self.slots_file.close()
+
+
+class TerritoryCounter:
+    def __init__(self, index, tmp_dir=None):
+        self.index = index
+        self.rels = sorted(index.boundaries)
+        self.slot = {rel: i for i, rel in enumerate(self.rels)}
+        self.counts = [[0, 0, 0] for _ in self.rels]  # nodes, ways, relations
+        self.nodes = IdSlotMap(tmp_dir)
+        self.ways = IdSlotMap(tmp_dir)
+
+    def node(self, node_id, lat, lon):
+        for rel in self.index.locate_all(lat, lon):
+            s = self.slot[rel]
+            self.counts[s][0] += 1
+            self.nodes.add(node_id, s)
+
+    def way(self, way_id, refs):
+        slots = set()
+        for ref in refs:
+            slots |= self.nodes.lookup(ref)
+        for s in sorted(slots):
+            self.counts[s][1] += 1
+            self.ways.add(way_id, s)
+
+    def relation(self, members):
+        """members: iterable of (type, ref) with type 'node'/'way'/'relation'."""
+        slots = set()
+        for mtype, ref in members:
+            if mtype == "node":
+                slots |= self.nodes.lookup(ref)
+            elif mtype == "way":
+                slots |= self.ways.lookup(ref)
+        for s in slots:
+            self.counts[s][2] += 1
+
+    def results(self):
+        """{rel: (name, stats)} in the same shape as ts.parse_overpass (names scrubbed the same way)."""
+        out = {}
+        for rel, (n, w, r) in zip(self.rels, self.counts):
+            name = territory_index.scrub_name(self.index.name(rel) or "unknown")
+            out[rel] = (name, {"nodes": n, "ways": w, "relations": r, "areas": 0, "total": n + w + r})
+        return out
+
+    def close(self):
+        self.nodes.close()
+        self.ways.close()
+
+
+def _stream_xml(path, counter):
+    context = ET.iterparse(path, events=("start", "end"))
+    _, root = next(context)
+    for event, el in context:
+        if event != "end":
+            continue
+        if el.tag == "node":
+            counter.node(int(el.get("id")), float(el.get("lat")), float(el.get("lon")))
+        elif el.tag == "way":
+            counter.way(int(el.get("id")), [int(nd.get("ref")) for nd in el.iter("nd")])
+        elif el.tag == "relation":
+            counter.relation((m.get("type"), int(m.get("ref"))) for m in el.iter("member"))
+        else:
+            continue
+        root.clear()  # drop finished elements so memory doesn't grow with the file
+
+
+def _stream_pbf(path, counter):
+    import osmium  # optional: pip install osmium
+
+    class Handler(osmium.SimpleHandler):
+        def node(self, n):
+            if n.location.valid():
+                counter.node(n.id, n.location.lat, n.location.lon)
+
+        def way(self, w):
+            counter.way(w.id, [nd.ref for nd in w.nodes])
+
+        def relation(self, r):
+            types = {"n": "node", "w": "way", "r": "relation"}
+            counter.relation((types[m.type], m.ref) for m in r.members)
+
+    Handler().apply_file(path)
+
+
+def count_extract(path, geom_dir):
+    """Counts every cached territory boundary from one pass over `path`. Returns {rel: (name, stats)}."""
+    index = territory_index.TerritoryIndex.load(geom_dir)
+    if not len(index):
+        raise RuntimeError(f"No territory boundaries cached in {geom_dir}; run ts.py against Overpass once first.")
+    counter = TerritoryCounter(index)
+    try:
+        if str(path).endswith(".pbf"):
+            _stream_pbf(str(path), counter)
+        else:
+            _stream_xml(str(path), counter)
+        return counter.results()
+    finally:
+        counter.close()
@@ -2,14 +2,26 @@ import argparse
 import json
 import os
 from pathlib import Path
-from datetime import datetime
-import statistics
-
+from datetime import datetime, timezone
+import unicodedata
+
+import profiling
+from publish import Snapshot
+from changeset_content import empty_counts, add_counts
+try:
+    import session_analytics
+except ImportError as e:  # numpy missing: pages are built without the sessions card
+    print(f"Session analytics skipped ({e}).")
+    session_analytics = None
 from ogfstats import TARGET_DIR, USERS_DIR, NAV_BAR, STYLE_BLOCK, GOOGLE_BLOCK, VERSION
 
 # OUT_DIR will be assigned at runtime based on args or default USERS_DIR
 OUT_DIR = None
 
+# Search index layout: <OUT_DIR>/search/<prefix>.json and <OUT_DIR>/search/uid/<n>.json
+SEARCH_PREFIX_LEN = 2
+UID_SHARD_SIZE = 10000
+
 # Using clear placeholder tags like {{TITLE}} makes replacement foolproof
 PAGE_TEMPLATE = """<!DOCTYPE html>
 <html lang="en">
@@ -61,7 +73,9 @@ PAGE_TEMPLATE = """<!DOCTYPE html>
         <p>Total changesets: {{TOTAL_CS}}</p>
         <p>Total objects changed: {{TOTAL_OBJS}}</p>
         <p>Average changeset position: {{AVG_POS}}</p>
+        {{CONTENT}}
       </div>
+      {{SESSIONS}}
     </div>
 
   </div>
@@ -82,6 +96,8 @@ PAGE_TEMPLATE = """<!DOCTYPE html>
 
   Highcharts.chart('hour_bar', { chart: { type: 'column' }, title: { text: 'Mapping Hours' }, xAxis: { categories: [...Array(24).keys()].map(h=>String(h)) }, series: [{ name: 'Changesets', data: Array.from({length:24}, (_,i)=>userData.hours[i]||0) }] });
 
+  if (userData.sessions) Highcharts.chart('session_hist', { chart: { type: 'column' }, title: { text: 'Session Length' }, xAxis: { categories: Object.keys(userData.sessions.length_histogram) }, legend: { enabled: false }, series: [{ name: 'Sessions', data: Object.values(userData.sessions.length_histogram) }] });
+
   // sources table
   const tbody = document.getElementById('sources_table');
   const sortedSources = Object.entries(userData.sources).sort((a,b)=>b[1]-a[1]).slice(0,50);
@@ -100,73 +116,165 @@ PAGE_TEMPLATE = """<!DOCTYPE html>
 """
 
 
-def build_user_page(userfile: Path):
-    try:
-        lst = json.loads(userfile.read_text(encoding='utf-8'))
-    except Exception as e:
-        print(f"Failed to read {userfile}: {e}")
-        return
-    if not lst:
-        return
-    # sort by created_at
-    lst_sorted = sorted(lst, key=lambda x: x.get('created_at') or '')
-    uid = userfile.stem
-    user = lst_sorted[-1].get('user', '')
-
-    per_day_cs = {}
-    per_day_objs = {}
-    editors = {}
-    sources = {}
-    hours = [0]*24
-    lats = []
-    lons = []
-
-    for e in lst_sorted:
-        ts = e.get('created_at') or e.get('created_at') or ''
+def iter_json_array(path: Path, chunk_size=1 << 16):
+    """Yields the elements of a JSON array file one at a time; only one element (plus a chunk) is in memory."""
+    decoder = json.JSONDecoder()
+    with open(path, encoding='utf-8') as f:
+        buf, pos, eof, started = '', 0, False, False
+        while True:
+            while pos < len(buf) and buf[pos] in ' \t\r\n,':
+                pos += 1
+            if pos >= len(buf):
+                if eof:
+                    return
+                more = f.read(chunk_size)
+                eof = not more
+                buf, pos = buf[pos:] + more, 0
+                continue
+            if not started:
+                if buf[pos] != '[':
+                    raise ValueError(f"{path}: not a JSON array")
+                started = True
+                pos += 1
+                continue
+            if buf[pos] == ']':
+                return
+            try:
+                obj, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                more = f.read(chunk_size)
+                eof = not more
+                buf, pos = buf[pos:] + more, 0
+                continue
+            yield obj
+            pos = end
+
+
+SESSIONS_CARD = """<div class="card full-width">
+        <h2>Editing Sessions</h2>
+        <p>{sessions} sessions (a break of over {gap} minutes starts a new one) &nbsp; | &nbsp; Median length: {median_session_minutes} min &nbsp; | &nbsp; Mean: {mean_session_minutes} min &nbsp; | &nbsp; Longest: {longest_session_minutes} min</p>
+        <p>Median changes per session: {median_changes_per_session} &nbsp; | &nbsp; Active days: {active_days} &nbsp; | &nbsp; Longest streak: {longest_streak} days &nbsp; | &nbsp; Current streak: {current_streak} days</p>
+        <div id="session_hist" class="chart-container" style="height:260px"></div>
+      </div>"""
+
+
+def load_sessions(files):
+    """Streams every user file once into one columnar table and computes all users' sessions on it.
+    Returns ({uid: stats}, site summary)."""
+    table = session_analytics.ChangesetTable()
+    for f in files:
+        user = table.add_user(f.stem)
+        try:
+            for e in iter_json_array(f):
+                table.add(user, e.get('created_at'), e.get('closed_at'), e.get('changes_count'))
+        except Exception as ex:
+            print(f"Failed to read {f}: {ex}")
+    per_user, summary = session_analytics.compute(table, datetime.now(timezone.utc).date())
+    skipped = f" ({table.skipped} changesets with unreadable created_at skipped)" if table.skipped else ""
+    print(f"Sessions: {summary['sessions']} across {summary['users']} users{skipped}.")
+    return per_user, summary
+
+
+def tally_changesets(entries, stop_if_unordered=False):
+    """Per-day/editor/source/hour tallies and running sums over `entries`, in the order given.
+    With stop_if_unordered, gives up (returning None) at the first entry older than the one before it."""
+    t = {'per_day_cs': {}, 'per_day_objs': {}, 'editors': {}, 'sources': {}, 'hours': [0]*24,
+         'lat_sum': 0.0, 'lon_sum': 0.0, 'pos_count': 0, 'total_cs': 0, 'total_objs': 0,
+         'content': empty_counts(), 'enriched': 0, 'first': None, 'last': None}
+    prev_ts = None
+    for e in entries:
+        ts = e.get('created_at') or ''
+        if stop_if_unordered and prev_ts is not None and ts < prev_ts:
+            return None
+        prev_ts = ts
+        t['total_cs'] += 1
+        # Same picks as a stable sort: first is the earliest-seen minimum, last the latest-seen maximum
+        if t['first'] is None or ts < (t['first'].get('created_at') or ''):
+            t['first'] = e
+        if t['last'] is None or ts >= (t['last'].get('created_at') or ''):
+            t['last'] = e
+
         day = ts.split('T')[0] if 'T' in ts else ts
-        per_day_cs[day] = per_day_cs.get(day, 0) + 1
-        per_day_objs[day] = per_day_objs.get(day, 0) + int(e.get('changes_count') or e.get('changes_count')==0 and 0 or 0) if e.get('changes_count') is not None else per_day_objs.get(day,0)
+        t['per_day_cs'][day] = t['per_day_cs'].get(day, 0) + 1
+        t['per_day_objs'][day] = t['per_day_objs'].get(day, 0) + int(e.get('changes_count') or 0)
+        t['total_objs'] += int(e.get('changes_count') or 0)
         ed = e.get('created_by') or ''
-        if ed: editors[ed] = editors.get(ed,0)+1
+        if ed: t['editors'][ed] = t['editors'].get(ed,0)+1
         src = e.get('source') or ''
-        if src: sources[src] = sources.get(src,0)+1
+        if src: t['sources'][src] = t['sources'].get(src,0)+1
         try:
-            cts = e.get('created_at')
             h = 0
-            if cts and 'T' in cts:
-                h = int(cts.split('T')[1].split(':')[0])
-            hours[h] += 1
+            if ts and 'T' in ts:
+                h = int(ts.split('T')[1].split(':')[0])
+            t['hours'][h] += 1
         except:
             pass
         if e.get('lat') is not None and e.get('lon') is not None:
             try:
-                lats.append(float(e.get('lat')))
-                lons.append(float(e.get('lon')))
+                lat, lon = float(e.get('lat')), float(e.get('lon'))
+                t['lat_sum'] += lat
+                t['lon_sum'] += lon
+                t['pos_count'] += 1
             except:
                 pass
+        if e.get('content'):
+            t['enriched'] += 1
+            add_counts(t['content'], e['content'])
+    return t
 
-    total_cs = len(lst_sorted)
-    total_objs = sum([int(e.get('changes_count') or 0) for e in lst_sorted])
-    avg_pos = {'lat': None, 'lon': None}
-    if lats and lons:
-        avg_pos['lat'] = sum(lats)/len(lats)
-        avg_pos['lon'] = sum(lons)/len(lons)
 
-    first_ts = lst_sorted[0].get('created_at','')
-    last_ts = lst_sorted[-1].get('created_at','')
-    first_pos = {'lat': lst_sorted[0].get('lat'), 'lon': lst_sorted[0].get('lon')}
-    last_pos = {'lat': lst_sorted[-1].get('lat'), 'lon': lst_sorted[-1].get('lon')}
+def build_user_page(userfile: Path, snap: Snapshot, sessions=None):
+    """Renders one user page into `snap` from a single streaming pass over the user file. Memory stays flat in the
+    number of changesets: only per-day/editor/source/hour tallies and running sums are kept.
+    Returns {'uid', 'user', 'total'} for the indexes, or None."""
+    uid = userfile.stem
+    try:
+        t = tally_changesets(iter_json_array(userfile), stop_if_unordered=True)
+        if t is None:
+            # User files are appended in created_at order; an older, unordered file is tallied in sorted
+            # order (all in memory, as before) so the page comes out exactly as it always did
+            t = tally_changesets(sorted(iter_json_array(userfile), key=lambda x: x.get('created_at') or ''))
+    except Exception as ex:
+        print(f"Failed to read {userfile}: {ex}")
+        return
+    if not t['total_cs']:
+        return
+
+    total_cs, total_objs = t['total_cs'], t['total_objs']
+    content, enriched = t['content'], t['enriched']
+    first, last = t['first'], t['last']
+    user = last.get('user', '')
+
+    avg_pos = {'lat': None, 'lon': None}
+    if t['pos_count']:
+        avg_pos['lat'] = t['lat_sum']/t['pos_count']
+        avg_pos['lon'] = t['lon_sum']/t['pos_count']
+
+    # Per-type breakdown, only for changesets enriched with --enrich
+    content_html = ''
+    if enriched:
+        rows = ''.join(f"<tr><td>{a.title()}</td><td>{c['node']}</td><td>{c['way']}</td><td>{c['relation']}</td></tr>" for a, c in content.items())
+        content_html = (f"<p>Object changes ({enriched} of {total_cs} changesets analysed):</p>"
+                        f"<table><thead><tr><th></th><th>Nodes</th><th>Ways</th><th>Relations</th></tr></thead><tbody>{rows}</tbody></table>")
+
+    first_ts = first.get('created_at','')
+    last_ts = last.get('created_at','')
+    first_pos = {'lat': first.get('lat'), 'lon': first.get('lon')}
+    last_pos = {'lat': last.get('lat'), 'lon': last.get('lon')}
 
     data_json = json.dumps({
-        'per_day_cs': per_day_cs,
-        'per_day_objs': per_day_objs,
-        'editors': editors,
-        'sources': sources,
-        'hours': hours,
+        'per_day_cs': t['per_day_cs'],
+        'per_day_objs': t['per_day_objs'],
+        'editors': t['editors'],
+        'sources': t['sources'],
+        'hours': t['hours'],
         'map_center': avg_pos,
         'avg_pos': avg_pos,
         'first_pos': first_pos,
         'last_pos': last_pos,
+        **({'sessions': sessions} if sessions else {}),
     })
 
     # Switched from .format() to clean text replacement chains
@@ -182,18 +290,68 @@ def build_user_page(userfile: Path):
             .replace("{{TOTAL_CS}}", str(total_cs))
             .replace("{{TOTAL_OBJS}}", str(total_objs))
             .replace("{{AVG_POS}}", f"{avg_pos.get('lat')},{avg_pos.get('lon')}")
+            .replace("{{CONTENT}}", content_html)
+            .replace("{{SESSIONS}}", SESSIONS_CARD.format(gap=session_analytics.SESSION_GAP // 60, **sessions) if sessions else '')
             .replace("{{DATA_JSON}}", data_json)
             .replace("{{VERSION}}", VERSION))
 
-    outpath = OUT_DIR / f"{uid}.html"
-    outpath.write_text(html, encoding='utf-8')
-    print(f"Wrote {outpath}")
+    snap.write_text(f"{OUT_DIR.name}/{uid}.html", html)
+    print(f"Wrote {OUT_DIR / f'{uid}.html'}")
+    return {'uid': uid, 'user': user or '', 'total': total_cs}
+
+
+def normalize_name(name: str) -> str:
+    # lowercase, strip accents and drop anything that isn't a letter or digit
+    decomposed = unicodedata.normalize('NFKD', name or '')
+    return ''.join(c for c in decomposed if c.isalnum()).lower()
 
 
-def main():
+def search_shard_key(name: str) -> str:
+    norm = normalize_name(name)[:SEARCH_PREFIX_LEN]
+    return norm if norm else '_'
+
+
+def build_search_index(index: list, snap: Snapshot, prefix: str):
+    """Writes prefix shards (ranked by total changesets) and uid-range shards for client-side search
+    under <prefix>/search/ in `snap`."""
+    search_dir = f"{prefix}/search"
+
+    prefixes = {}
+    uid_ranges = {}
+    for u in index:
+        prefixes.setdefault(search_shard_key(u['user']), []).append([u['uid'], u['user'], u['total']])
+        try:
+            shard = int(u['uid']) // UID_SHARD_SIZE
+        except ValueError:
+            continue
+        uid_ranges.setdefault(shard, {})[u['uid']] = [u['user'], u['total']]
+
+    # every shard is rewritten, so ones left over from previous runs (removed prefixes, uid ranges) aren't carried
+    snap.drop(search_dir)
+    for key, rows in prefixes.items():
+        rows.sort(key=lambda r: (-r[2], r[1].lower()))
+        snap.write_text(f"{search_dir}/{key}.json", json.dumps(rows, separators=(',', ':')))
+    for shard, rows in uid_ranges.items():
+        snap.write_text(f"{search_dir}/uid/{shard}.json", json.dumps(rows, separators=(',', ':')))
+
+    meta = {
+        'prefix_len': SEARCH_PREFIX_LEN,
+        'uid_shard_size': UID_SHARD_SIZE,
+        'users': len(index),
+        'prefixes': {k: len(v) for k, v in sorted(prefixes.items())},
+        'uid_shards': sorted(uid_ranges),
+    }
+    snap.write_text(f"{search_dir}/meta.json", json.dumps(meta, separators=(',', ':')))
+    print(f"Search index: {len(prefixes)} prefix shards, {len(uid_ranges)} uid shards.")
+
+
+def main(argv=None):
     parser = argparse.ArgumentParser()
     parser.add_argument('--outdir', type=str, default=None, help='Base output directory (e.g. ./site). Uses <outdir>/users as input and output.')
-    args = parser.parse_args()
+    profiling.add_argument(parser)
+    args = parser.parse_args(argv)
+    # No-op when ogfstats.py already has a session running around this call
+    started = profiling.start(args.profile, "user_pages")
 
     global OUT_DIR
     if args.outdir:
@@ -207,26 +365,36 @@ def main():
     # ensure output dir exists
     OUT_DIR.mkdir(parents=True, exist_ok=True)
 
-    files = sorted(users_src.glob('*.json'))
-    for f in files:
-        if f.name == 'index.json':
-            continue
-        build_user_page(f)
-
-    # rebuild index.json (uid + user)
-    index = []
-    for f in files:
-        if f.name == 'index.json':
-            continue
-        try:
-            lst = json.loads(f.read_text(encoding='utf-8'))
-            if not lst:
-                continue
-            index.append({'uid': f.stem, 'user': lst[-1].get('user','')})
-        except:
-            continue
-    (OUT_DIR / 'index.json').write_text(json.dumps(index, indent=2), encoding='utf-8')
+    files = [f for f in sorted(users_src.glob('*.json')) if f.name not in ('index.json', 'sessions.json')]
+    per_user, summary = {}, None
+    if session_analytics is not None:
+        with profiling.stage("sessions"):
+            per_user, summary = load_sessions(files)
+
+    # Pages, indexes and search shards go out as one generation of ogfstats.py's snapshots (see publish.Snapshot)
+    snap = Snapshot(OUT_DIR.parent)
+    rows = []
+    with profiling.stage("user_pages"):
+        for f in files:
+            row = build_user_page(f, snap, per_user.get(f.stem))
+            if row:
+                rows.append(row)
+
+    # rebuild index.json (uid + user) from what the page pass already read
+    with profiling.stage("user_index"):
+        write_indexes(snap, rows, summary)
+        snap.commit()
     print('User pages generation complete.')
+    if started:
+        profiling.finish()
+
+
+def write_indexes(snap, rows, sessions_summary=None):
+    index = [{'uid': r['uid'], 'user': r['user']} for r in rows]
+    snap.write_json(f"{OUT_DIR.name}/index.json", index, indent=2)
+    if sessions_summary is not None:
+        snap.write_json(f"{OUT_DIR.name}/sessions.json", sessions_summary, indent=2)
+    build_search_index(rows, snap, OUT_DIR.name)
 
 
 if __name__ == '__main__':
@@ -1,15 +1,22 @@
 import argparse
+import gzip
+import io
 import json
 import sys
 import time
 import os
+import threading
 from datetime import datetime, timezone, timedelta
 from pathlib import Path
 from urllib.request import urlopen, Request
 import xml.etree.ElementTree as ET
 from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from email.utils import formatdate, parsedate_to_datetime
 import socket
 
+from changeset_store import ChangesetStore
+from publish import Snapshot
+
 # --- CONFIGURATION ---
 OGF_CHANGESETS_URL = "https://opengeofiction.net/api/0.6/changesets"
 VERSION = "3.2"
@@ -149,13 +156,20 @@ function renderVersionHistory() {{
 
 async function load() {{
   try {{
-    const resp = await fetch('data.json', {{ cache: 'no-store' }});
+    // no-cache revalidates with the ETag, so unchanged data comes back as a 304
+    const resp = await fetch('data.json', {{ cache: 'no-cache' }});
     rawData = await resp.json();
     updateCharts(rawData[mode]);
     updateLeaderboards(rawData);
   }} catch(e) {{ console.error("Data load failed", e); }}
 }}
 
+// The server pushes an event whenever data.json is rewritten; only then refetch
+if (window.EventSource) {{
+  const events = new EventSource('/events');
+  events.addEventListener('update', () => load());
+}}
+
 function updateCharts(entries) {{
   if(!entries) return;
   const sorted = entries.sort((a,b)=>Date.parse(a.timestamp)-Date.parse(b.timestamp));
@@ -199,8 +213,8 @@ function fillTable(tableId, list) {{
     }});
 }}
 
-document.getElementById('btnHourly').addEventListener('click', ()=>{{ mode = 'hourly'; load(); }});
-document.getElementById('btnDaily').addEventListener('click', ()=>{{ mode = 'daily'; load(); }});
+document.getElementById('btnHourly').addEventListener('click', ()=>{{ mode = 'hourly'; if(rawData) updateCharts(rawData[mode]); }});
+document.getElementById('btnDaily').addEventListener('click', ()=>{{ mode = 'daily'; if(rawData) updateCharts(rawData[mode]); }});
 
 load();
 </script>
@@ -208,6 +222,123 @@ load();
 </html>
 """
 
+# --- HTTP SERVING ---
+COMPRESSIBLE = {".html", ".json", ".js", ".css", ".csv", ".txt", ".svg"}
+SSE_HEARTBEAT = 15  # seconds between keep-alive comments on /events
+
+_update_cond = threading.Condition()
+_update_state = {"generation": 0, "payload": {}}
+_gzip_cache = {}  # path -> (file version, compressed bytes)
+
+def notify_update(payload: dict):
+    """Wakes every /events listener with a small description of what changed."""
+    with _update_cond:
+        _update_state["generation"] += 1
+        _update_state["payload"] = payload
+        _update_cond.notify_all()
+
+class StatsHandler(SimpleHTTPRequestHandler):
+    """Static files with gzip, ETag/Last-Modified revalidation, plus a server-sent events feed."""
+
+    def do_GET(self):
+        if self.path.split("?")[0] == "/events":
+            return self.serve_events()
+        return super().do_GET()
+
+    def serve_events(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        with _update_cond:
+            seen = _update_state["generation"]
+        try:
+            while True:
+                with _update_cond:
+                    _update_cond.wait_for(lambda: _update_state["generation"] != seen, timeout=SSE_HEARTBEAT)
+                    generation, payload = _update_state["generation"], _update_state["payload"]
+                if generation == seen:
+                    self.wfile.write(b": keep-alive\n\n")
+                else:
+                    seen = generation
+                    msg = json.dumps({"generation": generation, **payload})
+                    self.wfile.write(f"event: update\nid: {generation}\ndata: {msg}\n\n".encode("utf-8"))
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def send_head(self):
+        path = self.translate_path(self.path)
+        # "/" and other directory URLs serve their index.html; give it the same gzip/ETag handling.
+        # Directories without the trailing slash still go to the base class for its redirect.
+        if os.path.isdir(path) and self.path.split("?", 1)[0].split("#", 1)[0].endswith("/"):
+            for index in ("index.html", "index.htm"):
+                if os.path.isfile(os.path.join(path, index)):
+                    path = os.path.join(path, index)
+                    break
+        if not os.path.isfile(path):
+            return super().send_head()
+        try:
+            st = os.stat(path)
+        except OSError:
+            return super().send_head()
+
+        version = f"{st.st_mtime_ns:x}-{st.st_size:x}"
+        use_gzip = self.wants_gzip(path)
+        # Each encoding is its own representation, so each gets its own validator
+        etag = f'"{version}-gz"' if use_gzip else f'"{version}"'
+        if self.not_modified(etag, st.st_mtime):
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Vary", "Accept-Encoding")
+            self.end_headers()
+            return None
+
+        body, encoding = self.read_body(path, st, version, use_gzip)
+        self.send_response(200)
+        self.send_header("Content-Type", self.guess_type(path))
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", etag)
+        self.send_header("Last-Modified", formatdate(st.st_mtime, usegmt=True))
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Vary", "Accept-Encoding")
+        if encoding:
+            self.send_header("Content-Encoding", encoding)
+        self.end_headers()
+        return io.BytesIO(body)
+
+    def not_modified(self, etag, mtime):
+        inm = self.headers.get("If-None-Match")
+        if inm:
+            return etag in [t.strip() for t in inm.split(",")] or inm.strip() == "*"
+        ims = self.headers.get("If-Modified-Since")
+        if ims:
+            try:
+                return int(mtime) <= parsedate_to_datetime(ims).timestamp()
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    def wants_gzip(self, path):
+        return "gzip" in self.headers.get("Accept-Encoding", "") and os.path.splitext(path)[1] in COMPRESSIBLE
+
+    def read_body(self, path, st, version, use_gzip):
+        if not use_gzip:
+            with open(path, "rb") as f:
+                return f.read(), None
+        # Prefer a precompressed sibling written alongside the file
+        gz_path = path + ".gz"
+        if os.path.exists(gz_path) and os.path.getmtime(gz_path) >= st.st_mtime:
+            with open(gz_path, "rb") as f:
+                return f.read(), "gzip"
+        cached = _gzip_cache.get(path)
+        if cached and cached[0] == version:
+            return cached[1], "gzip"
+        with open(path, "rb") as f:
+            body = gzip.compress(f.read(), compresslevel=6)
+        _gzip_cache[path] = (version, body)
+        return body, "gzip"
+
 def get_initial_data():
     return {
         "hourly": [], 
@@ -234,7 +365,9 @@ def fetch_changesets_for_hour(start: datetime):
         xml_bytes = resp.read()
     root = ET.fromstring(xml_bytes)
     return [
-        {"user": cs.get("user"), "uid": cs.get("uid"), "changes_count": int(cs.get("changes_count", "0"))}
+        {"id": cs.get("id"), "user": cs.get("user"), "uid": cs.get("uid"), "changes_count": int(cs.get("changes_count", "0")),
+         "created_at": cs.get("created_at"),
+         "created_by": next((t.get("v") for t in cs.findall("tag") if t.get("k") == "created_by"), "")}
         for cs in root.findall("changeset")
     ]
 
@@ -248,12 +381,17 @@ def tally_users(entries):
     return [{"user": u, "uid": uid, "count": c["count"], "objects": c["objects"]}
             for (u, uid), c in sorted(counts.items(), key=lambda kv: (kv[1]["count"], kv[1]["objects"]), reverse=True)]
 
-def update_data_file(out_json: Path, hour_start: datetime, cid: int, entries: list):
+def update_data_file(out_json: Path, hour_start: datetime, cid: int, entries: list, store: ChangesetStore = None):
     # Load or initialize
     data = get_initial_data()
     if out_json.exists():
+        # Don't silently start over from empty data if the file can't be read
         try: data = json.loads(out_json.read_text(encoding="utf-8") or "{}")
-        except: pass
+        except Exception as e: raise RuntimeError(f"Unreadable {out_json}, skipping update: {e}")
+
+    # Everything this cycle publishes (page, data, archives) goes out as one generation
+    snap = Snapshot(out_json.parent)
+    snap.write_text("index.html", INDEX_HTML)
 
     # --- HARD RESET / ARCHIVE LOGIC ---
     current_month_str = hour_start.strftime("%Y-%m")
@@ -263,10 +401,7 @@ def update_data_file(out_json: Path, hour_start: datetime, cid: int, entries: li
         last_month = last_update_ts[:7]
         if current_month_str != last_month:
             # 1. Archive the old data
-            archive_dir = out_json.parent / "monthly_archives"
-            archive_dir.mkdir(exist_ok=True)
-            archive_path = archive_dir / f"{last_month}.json"
-            archive_path.write_text(json.dumps(data, indent=2))
+            snap.write_text(f"monthly_archives/{last_month}.json", json.dumps(data, indent=2))
             
             # 2. PERFORM HARD RESET (Wipe file content completely)
             temp_rolling = data.get("rolling24", []) # Keep rolling 24 for continuity
@@ -291,6 +426,35 @@ def update_data_file(out_json: Path, hour_start: datetime, cid: int, entries: li
         d_list.append({"timestamp": ts_str, "changeset_id": cid, "change": d_change})
 
     # --- UPDATE LEADERBOARD DATA ---
+    if store is not None:
+        # SQLite backend: leaderboards are aggregate queries, nothing is buffered in data.json
+        store.add(entries, fallback_hour=hour_start)
+        month_start = hour_start.replace(day=1, hour=0)
+        next_hour = hour_start + timedelta(hours=1)
+        # The hourly board ranks this cycle's fetch, as the JSON path does. `?time=HH:00` returns changesets
+        # closed since HH:00, most of them created earlier, and the store files rows by created hour,
+        # so a created-hour query would miss nearly all of them.
+        data.setdefault("hourly_leaderboards", []).append({
+            "timestamp": ts_str,
+            "leaderboard": tally_users(entries)
+        })
+        data["hourly_leaderboards"] = data["hourly_leaderboards"][-48:]
+        data["daily_leaderboard"] = store.leaderboard(next_hour - timedelta(hours=24), next_hour)
+        data["monthly_leaderboard"] = store.leaderboard(month_start, next_hour)
+        data["rolling24"] = []
+        data["monthly_store"] = []
+    else:
+        update_json_leaderboards(data, hour_start, ts_str, entries)
+
+    # Write back (plus a precompressed copy for the HTTP handler)
+    raw = json.dumps(data, indent=2)
+    snap.write_text(out_json.name, raw)
+    snap.path(out_json.name + ".gz").write_bytes(gzip.compress(raw.encode("utf-8"), compresslevel=9))
+    snap.commit()
+
+    notify_update({"timestamp": ts_str, "hourly": mode_list[-1], "new_entries": len(entries)})
+
+def update_json_leaderboards(data: dict, hour_start: datetime, ts_str: str, entries: list):
     # 1. Hourly Leaderboard
     data.setdefault("hourly_leaderboards", []).append({
         "timestamp": ts_str,
@@ -310,16 +474,25 @@ def update_data_file(out_json: Path, hour_start: datetime, cid: int, entries: li
     data.setdefault("monthly_store", []).extend(entries)
     data["monthly_leaderboard"] = tally_users(data["monthly_store"])
 
-    # Write back
-    out_json.write_text(json.dumps(data, indent=2), encoding="utf-8")
-
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--sqlite", type=str, default=None, help="Keep changesets in this SQLite file instead of JSON buffers in data.json")
+    parser.add_argument("--datadir", type=str, default=None, help="Directory to publish and serve from (default: local-site/ next to this script)")
     args = parser.parse_args()
 
-    outdir = Path(__file__).parent.resolve()
-    (outdir / "index.html").write_text(INDEX_HTML, encoding='utf-8')
+    # Served files and their snapshot generations live in their own directory, never among the sources
+    outdir = Path(args.datadir or Path(__file__).parent / "local-site").resolve()
+    outdir.mkdir(parents=True, exist_ok=True)
+    store = ChangesetStore(args.sqlite) if args.sqlite else None
+
+    snap = Snapshot(outdir)
+    snap.write_text("index.html", INDEX_HTML)
+    legacy = Path(__file__).parent / "data.json"
+    if not (outdir / "data.json").exists() and legacy.is_file():
+        # Pick up data.json from before it moved out of the script directory
+        snap.write_text("data.json", legacy.read_text(encoding="utf-8"))
+    snap.commit()
 
     # Port management
     port = args.port
@@ -328,8 +501,7 @@ def main():
             s.bind(("0.0.0.0", port))
     except: port = 0 # Random port if requested is busy
 
-    import threading
-    handler = lambda *a, **kw: SimpleHTTPRequestHandler(*a, directory=str(outdir), **kw)
+    handler = lambda *a, **kw: StatsHandler(*a, directory=str(outdir), **kw)
     server = ThreadingHTTPServer(("0.0.0.0", port), handler)
     print(f"OGFStats v{VERSION} serving at http://localhost:{server.server_port}")
     threading.Thread(target=server.serve_forever, daemon=True).start()
@@ -341,7 +513,7 @@ def main():
         try:
             cid = fetch_first_changeset_id(OGF_CHANGESETS_URL)
             entries = fetch_changesets_for_hour(hour_start)
-            update_data_file(outdir / "data.json", hour_start, cid, entries)
+            update_data_file(outdir / "data.json", hour_start, cid, entries, store)
             print(f"[{now.strftime('%Y-%m-%d %H:%M:%S')}] Update successful.")
         except Exception as e:
             print(f"[{now.strftime('%Y-%m-%d %H:%M:%S')}] Error: {e}")
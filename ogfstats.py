@@ -1,20 +1,47 @@
 import argparse
+import asyncio
+import itertools
 import json
 import sys
 import time
 import os
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone, timedelta
 from pathlib import Path
 from urllib.request import urlopen, Request
 import xml.etree.ElementTree as ET
 
+import territory_index
+import day_archive
+import changeset_index
+import pipeline
+import profiling
+import changeset_content
+from publish import Snapshot, atomic_write_json
+from series import HourlySeries, epoch_hour, lttb, chart_points
+from changeset_store import ChangesetStore
+
 # --- CONFIGURATION ---
 OGF_CHANGESETS_URL = "https://opengeofiction.net/api/0.6/changesets"
 VERSION = "6.0"
 TARGET_DIR = Path("/var/www/ogfstats")
 CACHE_DIR = TARGET_DIR / "user_cache"
 USERS_DIR = TARGET_DIR / "users"
+GEOM_DIR = TARGET_DIR / "tdata" / "territory-geom"
+SERIES_DIR = TARGET_DIR / "series"
+STORE = None  # optional ChangesetStore for the query API, set with --store
+CONTENT = None  # optional changeset_content.ContentCache, set with --enrich
+CONTENT_BUDGET = changeset_content.BUDGET  # downloads per cycle, --enrich-budget
+REPLICATION = None  # replication base URL or local directory, set with --replication
+CONTENT_PENDING_MAX = 5000  # changesets remembered for enrichment in later cycles
+CHART_POINTS = 720  # trailing buckets exported into data.json; full history stays in SERIES_DIR
+CHART_RESOLUTIONS = {"1000": 1000, "200": 200}  # downsampled exports alongside "full", see publish_chart_series
+API_PAGE_LIMIT = 100  # the changesets API returns at most this many per call
+CATCHUP_WORKERS = 4  # parallel hour fetches during downtime catch-up
+CATCHUP_WINDOW = 24  # hours fetched per catch-up window before they're applied in order (and written together)
+SEEN_IDS_MAX = 5000  # newest changeset ids remembered in data.json to drop repeats across cycles
+FEED_KEEP = 168  # delta files kept in <TARGET_DIR>/feed (one week of hourly cycles)
 
 VERSION_HISTORY = [
     {"v": "6.0", "date": "2026-06-16", "note": "Individual user data :)"},
@@ -44,14 +71,31 @@ NAV_BAR = f"""
     </div>
     <script>
         (function(){{
-            let usersIndex = null;
-            async function loadIndex(){{
-                if(usersIndex) return usersIndex;
-                try{{
-                    const resp = await fetch('/users/index.json', {{ cache: 'no-store' }});
-                    usersIndex = await resp.json();
-                }}catch(e){{ usersIndex = []; }}
-                return usersIndex;
+            // Search shards written by generate_user_pages.build_search_index
+            const shardCache = {{}};
+            function normalizeName(s){{
+                return (s || '').normalize('NFKD').replace(/[^\\p{{L}}\\p{{N}}]/gu, '').toLowerCase();
+            }}
+            async function loadShard(path){{
+                if(!(path in shardCache)){{
+                    shardCache[path] = fetch(path).then(r => r.ok ? r.json() : null).catch(() => null);
+                }}
+                return shardCache[path];
+            }}
+            async function findUsers(q){{
+                if(/^\\d+$/.test(q)){{
+                    const rows = await loadShard(`/users/search/uid/${{Math.floor(Number(q) / 10000)}}.json`) || {{}};
+                    return rows[q] ? [{{ uid: q, user: rows[q][0] }}] : [];
+                }}
+                const norm = normalizeName(q);
+                // Names shorter than the prefix have their own shard (e.g. 'a.json' holds exactly the users named 'a',
+                // found on Enter), and names with no letters or digits at all live in '_.json', matched exactly
+                if(!norm){{
+                    const rows = await loadShard('/users/search/_.json') || [];
+                    return rows.filter(r => (r[1] || '').toLowerCase() === q.toLowerCase()).map(r => ({{ uid: r[0], user: r[1] }}));
+                }}
+                const rows = await loadShard(`/users/search/${{encodeURIComponent(norm.slice(0, 2))}}.json`) || [];
+                return rows.filter(r => normalizeName(r[1]).startsWith(norm)).map(r => ({{ uid: r[0], user: r[1] }}));
             }}
 
             function renderSuggestions(list, q){{
@@ -69,17 +113,16 @@ NAV_BAR = f"""
             }}
 
             async function doSuggest(q){{
-                if(!q){{ renderSuggestions([], q); return; }}
-                const idx = await loadIndex();
-                const low = q.toLowerCase();
-                const matched = idx.filter(u => (u.user || '').toLowerCase().includes(low)).slice(0,50);
+                // One character only narrows to the exact-name shard, so suggestions start at the second
+                if(!q || (!/^\d+$/.test(q) && normalizeName(q).length < 2)){{ renderSuggestions([], q); return; }}
+                const matched = (await findUsers(q)).slice(0,50);
                 renderSuggestions(matched, q);
             }}
 
             async function doSearch(q){{
                 if(!q) return;
-                const idx = await loadIndex();
-                const found = idx.find(u => (u.user||'').toLowerCase() === q.toLowerCase());
+                const matched = await findUsers(q);
+                const found = matched.find(u => (u.user||'').toLowerCase() === q.toLowerCase() || u.uid === q);
                 if(found) window.location = `/users/${{found.uid}}.html`;
             }}
 
@@ -254,13 +297,55 @@ INDEX_HTML = """<!DOCTYPE html>
         renderBar();
     }
 
-    function renderTrend() {
+    // Long-range series come from charts/<name>.<res>.json: the full history plus LTTB-downsampled
+    // copies. Each chart starts on the coarsest copy that fills its width and swaps to a finer one on zoom.
+    let chartIndex = {};
+    const chartCache = {};
+    const RESOLUTIONS = [200, 1000];
+
+    function loadSeries(name, res) {
+        const info = chartIndex[name];
+        if (!info) return Promise.resolve(null);
+        if (!info.resolutions.includes(res)) res = 'full';
+        const key = name + '.' + res;
+        if (!chartCache[key]) chartCache[key] = fetch(`charts/${key}.json`, { cache: 'no-cache' }).then(r => r.ok ? r.json() : null).catch(() => null);
+        return chartCache[key];
+    }
+
+    function pickResolution(fraction, width) {
+        // about one point per two pixels of what's visible
+        const r = RESOLUTIONS.find(r => r * fraction >= width / 2);
+        return r ? String(r) : 'full';
+    }
+
+    function zoomLoader(names) {
+        return async function (e) {
+            const chart = this.chart;
+            const { dataMin, dataMax } = this.getExtremes();
+            const fraction = e.min == null ? 1 : (e.max - e.min) / Math.max(1, dataMax - dataMin);
+            const res = pickResolution(fraction, chart.plotWidth);
+            if (chart.chartRes === res) return;
+            chart.chartRes = res;
+            const all = await Promise.all(names.map(n => loadSeries(n, res)));
+            all.forEach((data, i) => { if (data) chart.series[i].setData(data, false, false, false); });
+            chart.redraw();
+        };
+    }
+
+    async function initialSeries(names, width) {
+        if (!names.every(n => chartIndex[n])) return null;
+        return Promise.all(names.map(n => loadSeries(n, pickResolution(1, width))));
+    }
+
+    async function renderTrend() {
         const entries = rawData[mode];
-        const diffSeries = entries.map(d => [Date.parse(d.timestamp), d.change ?? 0]);
+        const width = document.getElementById('chartDiff').clientWidth || 1000;
+        const ranged = await initialSeries([mode + '.change', mode + '.changeset_id'], width);
+        const diffSeries = ranged ? ranged[0] : entries.map(d => [Date.parse(d.timestamp), d.change ?? 0]);
         Highcharts.chart('chartDiff', {
             chart: { type: 'column', zoomType: 'x' },
             title: { text: 'Changesets', align: 'left', style: { fontWeight: 'bold' } },
-            xAxis: { type: 'datetime', crosshair: true },
+            xAxis: { type: 'datetime', crosshair: true, events: ranged ? { afterSetExtremes: zoomLoader([mode + '.change']) } : {} },
             yAxis: { title: { text: 'Count' } },
             tooltip: { shared: true, intersect: false },
             plotOptions: { column: { stickyTracking: true, borderWidth: 0 } },
@@ -268,11 +353,11 @@ INDEX_HTML = """<!DOCTYPE html>
             credits: { enabled: false }
         });
 
-        const idSeries = entries.map(d => [Date.parse(d.timestamp), Number(d.changeset_id)]);
+        const idSeries = ranged ? ranged[1] : entries.map(d => [Date.parse(d.timestamp), Number(d.changeset_id)]);
         Highcharts.chart('chartID', {
             chart: { type: 'line', zoomType: 'x' },
             title: { text: 'ID History', align: 'left', style: { fontWeight: 'bold' } },
-            xAxis: { type: 'datetime', crosshair: true },
+            xAxis: { type: 'datetime', crosshair: true, events: ranged ? { afterSetExtremes: zoomLoader([mode + '.changeset_id']) } : {} },
             yAxis: { title: { text: 'ID' }, startOnTick: false, endOnTick: false },
             tooltip: { shared: true, intersect: false },
             plotOptions: { line: { stickyTracking: true } },
@@ -317,15 +402,17 @@ INDEX_HTML = """<!DOCTYPE html>
         const resp = await fetch('data.json', { cache: 'no-store' });
         rawData = await resp.json();
         document.getElementById('updateTime').innerText = "Last Sync: " + rawData.last_month_update;
+        chartIndex = await fetch('charts/index.json', { cache: 'no-cache' }).then(r => r.ok ? r.json() : {}).catch(() => ({}));
 
-        const mapperDaily = (rawData.daily_mapper_counts || []).map(d => [Date.parse(d.date), d.count]);
-        const mapperWeekly = (rawData.weekly_mapper_counts || []).map(d => [Date.parse(d.date), d.count]);
-        const mapperMonthly = (rawData.monthly_mapper_counts || []).map(d => [Date.parse(d.date), d.count]);
+        const mapperNames = ['mappers.daily', 'mappers.weekly', 'mappers.monthly'];
+        const mapperRanged = await initialSeries(mapperNames, document.getElementById('mapperChart').clientWidth || 1000);
+        const [mapperDaily, mapperWeekly, mapperMonthly] = mapperRanged ||
+            ['daily_mapper_counts', 'weekly_mapper_counts', 'monthly_mapper_counts'].map(k => (rawData[k] || []).map(d => [Date.parse(d.date), d.count]));
 
         Highcharts.chart('mapperChart', {
             chart: { type: 'line', zoomType: 'x' },
             title: { text: 'Unique Mappers (Rolling)', align: 'left', style: { fontWeight: 'bold' } },
-            xAxis: { type: 'datetime', crosshair: true },
+            xAxis: { type: 'datetime', crosshair: true, events: mapperRanged ? { afterSetExtremes: zoomLoader(mapperNames) } : {} },
             yAxis: { title: { text: 'Unique Users' } },
             tooltip: { shared: true, crosshairs: true },
             series: [
@@ -367,6 +454,15 @@ LEADERBOARD_HTML = """<!DOCTYPE html>
         <div id="fullUserChart" class="chart-container" style="height: 400px;"></div>
     </div>
 
+    <div class="card full-width" id="sessionsCard" style="display:none">
+        <h2>Editing Sessions (All Users)</h2>
+        <p id="sessionsMeta"></p>
+        <div class="grid-2">
+          <div id="sessionLengthChart" class="chart-container" style="height: 300px;"></div>
+          <div id="sessionsPerUserChart" class="chart-container" style="height: 300px;"></div>
+        </div>
+    </div>
+
     <div class="leaderboard-grid">
       <div class="leaderboard-card"><h2>Hourly</h2><div class="table-container"><table id="hourlyTable"><thead><tr><th onclick="sortRows('hourlyTable', 0)">User</th><th onclick="sortRows('hourlyTable', 1)">UID</th><th onclick="sortRows('hourlyTable', 2)">Edits</th><th onclick="sortRows('hourlyTable', 3)">Objs</th></tr></thead><tbody></tbody></table></div></div>
       <div class="leaderboard-card"><h2>Daily (Rolling 24h)</h2><div class="table-container"><table id="dailyTable"><thead><tr><th onclick="sortRows('dailyTable', 0)">User</th><th onclick="sortRows('dailyTable', 1)">UID</th><th onclick="sortRows('dailyTable', 2)">Edits</th><th onclick="sortRows('dailyTable', 3)">Objs</th></tr></thead><tbody></tbody></table></div></div>
@@ -419,7 +515,34 @@ LEADERBOARD_HTML = """<!DOCTYPE html>
         tbody.append(...sortedRows);
     }
 
+    function histChart(id, title, hist) {
+        Highcharts.chart(id, {
+            chart: { type: 'column' },
+            title: { text: title, align: 'left' },
+            xAxis: { categories: Object.keys(hist) },
+            yAxis: { title: { text: null } },
+            legend: { enabled: false },
+            series: [{ name: title, data: Object.values(hist), color: '#007bff' }],
+            credits: { enabled: false }
+        });
+    }
+
+    // Written by generate_user_pages.py; the card stays hidden until it exists
+    async function loadSessions() {
+        const s = await fetch('users/sessions.json', { cache: 'no-cache' }).then(r => r.ok ? r.json() : null).catch(() => null);
+        if (!s || !s.sessions) return;
+        document.getElementById('sessionsCard').style.display = '';
+        const p = s.longest_streak_percentiles || {};
+        document.getElementById('sessionsMeta').textContent =
+            `${s.sessions} sessions by ${s.users} users (new session after ${s.session_gap_minutes} min idle) | ` +
+            `median length ${s.median_session_minutes} min | median changes per session ${s.median_changes_per_session} | ` +
+            `longest streak p50/p90/p99: ${p['50']}/${p['90']}/${p['99']} days`;
+        histChart('sessionLengthChart', 'Session Length', s.session_length_histogram);
+        histChart('sessionsPerUserChart', 'Sessions per User', s.sessions_per_user_histogram);
+    }
+
     async function load() {
+        loadSessions();
         const resp = await fetch('data.json', { cache: 'no-store' });
         const data = await resp.json();
         renderFullChart(data.monthly_leaderboard || []);
@@ -465,54 +588,79 @@ def get_initial_data():
         "daily_mapper_counts": [], "weekly_mapper_counts": [], "monthly_mapper_counts": []
     }
 
+def parse_changeset(cs):
+    tags = {t.get('k'): t.get('v') for t in cs.findall('tag')}
+    try:
+        min_lat = float(cs.get('min_lat')) if cs.get('min_lat') else None
+        min_lon = float(cs.get('min_lon')) if cs.get('min_lon') else None
+        max_lat = float(cs.get('max_lat')) if cs.get('max_lat') else None
+        max_lon = float(cs.get('max_lon')) if cs.get('max_lon') else None
+    except:
+        min_lat = min_lon = max_lat = max_lon = None
+
+    lat = None; lon = None
+    if min_lat is not None and max_lat is not None:
+        lat = (min_lat + max_lat) / 2.0
+    if min_lon is not None and max_lon is not None:
+        lon = (min_lon + max_lon) / 2.0
+
+    return {
+        "id": cs.get("id"),
+        "user": cs.get("user"),
+        "uid": cs.get("uid"),
+        # replication diffs call it num_changes
+        "changes_count": int(cs.get("changes_count") or cs.get("num_changes") or 0),
+        "created_at": cs.get("created_at"),
+        "closed_at": cs.get("closed_at"),
+        # FIX: Explicitly pass "ts" down so monthly filtering condition handles it properly
+        "ts": cs.get("created_at"),
+        "comment": tags.get('comment',''),
+        "created_by": tags.get('created_by',''),
+        "source": tags.get('source',''),
+        "min_lat": min_lat,
+        "min_lon": min_lon,
+        "max_lat": max_lat,
+        "max_lon": max_lon,
+        "lat": lat,
+        "lon": lon
+    }
+
+def fetch_changesets(time_param):
+    """Raw /changesets?time=... call; raises on network or parse errors."""
+    url = f"{OGF_CHANGESETS_URL}?time={time_param}"
+    req = Request(url, headers={"User-Agent": f"ogf-stats-script/{VERSION}"})
+    with urlopen(req, timeout=20) as resp:
+        root = ET.fromstring(resp.read())
+    return [parse_changeset(cs) for cs in root.findall("changeset")]
+
 def fetch_recent_changesets(lookback_hours=2):
     start_time = datetime.now(timezone.utc) - timedelta(hours=lookback_hours)
-    url = f"{OGF_CHANGESETS_URL}?time={start_time.strftime('%Y-%m-%dT%H:00:00Z')}"
-    req = Request(url, headers={"User-Agent": f"ogf-stats-script/{VERSION}"})
     try:
-        with urlopen(req, timeout=20) as resp:
-            root = ET.fromstring(resp.read())
-
-        out = []
-        for cs in root.findall("changeset"):
-            tags = {t.get('k'): t.get('v') for t in cs.findall('tag')}
-            try:
-                min_lat = float(cs.get('min_lat')) if cs.get('min_lat') else None
-                min_lon = float(cs.get('min_lon')) if cs.get('min_lon') else None
-                max_lat = float(cs.get('max_lat')) if cs.get('max_lat') else None
-                max_lon = float(cs.get('max_lon')) if cs.get('max_lon') else None
-            except:
-                min_lat = min_lon = max_lat = max_lon = None
-
-            lat = None; lon = None
-            if min_lat is not None and max_lat is not None:
-                lat = (min_lat + max_lat) / 2.0
-            if min_lon is not None and max_lon is not None:
-                lon = (min_lon + max_lon) / 2.0
-
-            out.append({
-                "id": cs.get("id"),
-                "user": cs.get("user"),
-                "uid": cs.get("uid"),
-                "changes_count": int(cs.get("changes_count", "0")),
-                "created_at": cs.get("created_at"),
-                "closed_at": cs.get("closed_at"),
-                # FIX: Explicitly pass "ts" down so monthly filtering condition handles it properly
-                "ts": cs.get("created_at"),
-                "comment": tags.get('comment',''),
-                "created_by": tags.get('created_by',''),
-                "source": tags.get('source',''),
-                "min_lat": min_lat,
-                "min_lon": min_lon,
-                "max_lat": max_lat,
-                "max_lon": max_lon,
-                "lat": lat,
-                "lon": lon
-            })
-        return out
+        return fetch_changesets(start_time.strftime('%Y-%m-%dT%H:00:00Z'))
     except Exception as e:
         print(f"Fetch error: {e}"); return []
 
+def fetch_changeset_window(start, end):
+    """Changesets created in [start, end). The API caps each answer at API_PAGE_LIMIT (newest first),
+    so full pages are followed by moving the upper bound down to the oldest creation time seen."""
+    fmt = '%Y-%m-%dT%H:%M:%SZ'
+    out, seen = [], set()
+    upper = end
+    while True:
+        page = fetch_changesets(f"{start.strftime(fmt)},{upper.strftime(fmt)}")
+        fresh = [e for e in page if e["id"] not in seen]
+        for e in fresh: seen.add(e["id"])
+        out.extend(fresh)
+        if len(page) < API_PAGE_LIMIT or not fresh:
+            break
+        oldest = min(e["created_at"] for e in fresh if e.get("created_at"))
+        next_upper = datetime.strptime(oldest, fmt).replace(tzinfo=timezone.utc) + timedelta(seconds=1)
+        if next_upper >= upper:
+            break
+        upper = next_upper
+    # time=T1,T2 also matches changesets created earlier but closed after T1; those belong to older buckets
+    return [e for e in out if e.get("created_at") and start.strftime(fmt) <= e["created_at"] < end.strftime(fmt)]
+
 def tally_users(entries):
     counts = {}
     for e in entries:
@@ -521,33 +669,165 @@ def tally_users(entries):
         counts[key]["count"] += 1; counts[key]["objects"] += e.get("changes_count", 0)
     return [{"user": u, "uid": uid, "count": c["count"], "objects": c["objects"]} for (u, uid), c in sorted(counts.items(), key=lambda kv: (kv[1]["count"], kv[1]["objects"]), reverse=True)]
 
-def run_update(data_file, now):
+_territory_index = None
+_territory_index_mtime = None
+
+def get_territory_index():
+    # Boundaries are cached by ts.py; reload only when that directory changes
+    global _territory_index, _territory_index_mtime
+    mtime = GEOM_DIR.stat().st_mtime if GEOM_DIR.exists() else None
+    if _territory_index is None or mtime != _territory_index_mtime:
+        _territory_index = territory_index.TerritoryIndex.load(str(GEOM_DIR))
+        _territory_index_mtime = mtime
+    return _territory_index
+
+def tally_territories(entries, index):
+    groups = {}
+    for e in entries:
+        if e.get("territory"): groups.setdefault(e["territory"], []).append(e)
+    out = []
+    for rel, lst in groups.items():
+        users = tally_users(lst)
+        out.append({"rel": rel, "territory": index.name(rel) or rel, "count": len(lst),
+                    "objects": sum(e.get("changes_count", 0) for e in lst), "mappers": len(users), "top": users[:10]})
+    return sorted(out, key=lambda t: (t["count"], t["objects"]), reverse=True)
+
+MAPPER_COLUMNS = {"daily": "daily_mapper_counts", "weekly": "weekly_mapper_counts", "monthly": "monthly_mapper_counts"}
+
+def open_series(data):
+    """Opens the binary chart series, seeding empty ones from the JSON lists of older data.json files."""
+    hourly = HourlySeries(SERIES_DIR / "hourly.bin", ["changeset_id", "change"])
+    daily = HourlySeries(SERIES_DIR / "daily.bin", ["changeset_id", "change"])
+    mappers = HourlySeries(SERIES_DIR / "mappers.bin", list(MAPPER_COLUMNS))
+    parse = lambda ts: epoch_hour(datetime.fromisoformat(ts.replace("Z", "+00:00")))
+    for series, key in ((hourly, "hourly"), (daily, "daily")):
+        if not len(series):
+            for p in sorted(data.get(key, []), key=lambda p: p["timestamp"]):
+                series.put(parse(p["timestamp"]), changeset_id=p["changeset_id"], change=p["change"])
+    if not len(mappers):
+        rows = {}
+        for col, key in MAPPER_COLUMNS.items():
+            for p in data.get(key, []):
+                rows.setdefault(parse(p["date"]), {})[col] = p["count"]
+        for hour in sorted(rows):
+            mappers.put(hour, **rows[hour])
+    return hourly, daily, mappers
+
+def publish_chart_series(snap, charts):
+    """Writes charts/<name>.<resolution>.json for every {name: [[epoch_ms, value], ...]} at full
+    resolution and LTTB-downsampled, plus charts/index.json listing what exists."""
+    manifest = {}
+    for name, points in charts.items():
+        snap.write_json(f"charts/{name}.full.json", points, separators=(",", ":"))
+        resolutions = ["full"]
+        for res, threshold in CHART_RESOLUTIONS.items():
+            if len(points) > threshold:
+                snap.write_json(f"charts/{name}.{res}.json", lttb(points, threshold), separators=(",", ":"))
+                resolutions.append(res)
+        manifest[name] = {"points": len(points), "resolutions": resolutions}
+    snap.write_json("charts/index.json", manifest, separators=(",", ":"))
+
+def leaderboard_changes(before, after):
+    """Rows of `after` that are new or differ from `before`, plus uids that dropped out."""
+    old = {u["uid"]: u for u in before}
+    changed = [u for u in after if old.get(u["uid"]) != u]
+    current = {u["uid"] for u in after}
+    return changed, [uid for uid in old if uid not in current]
+
+def build_delta(seq, ts_str, data, prev_monthly, prev_daily, new_entries):
+    monthly_changed, monthly_removed = leaderboard_changes(prev_monthly, data["monthly_leaderboard"])
+    daily_changed, daily_removed = leaderboard_changes(prev_daily, data["daily_leaderboard"])
+    return {
+        "seq": seq,
+        "timestamp": ts_str,
+        "hourly": data["hourly"][-1],
+        "hourly_leaderboard": data["hourly_leaderboards"][-1],
+        "mapper_counts": {k: data[k][-1] for k in ("daily_mapper_counts", "weekly_mapper_counts", "monthly_mapper_counts")},
+        "monthly_leaderboard": {"changed": monthly_changed, "removed": monthly_removed},
+        "daily_leaderboard": {"changed": daily_changed, "removed": daily_removed},
+        "new_changesets": len(new_entries),
+    }
+
+def publish_delta(snap, root, delta):
+    """Writes feed/<seq>.json (immutable) and stages feed/latest.json in this cycle's snapshot."""
+    feed_dir = root / "feed"
+    atomic_write_json(feed_dir / f"{delta['seq']}.json", delta, separators=(",", ":"))
+    oldest = max(1, delta["seq"] - FEED_KEEP + 1)
+    for f in feed_dir.glob("*.json"):
+        if f.stem.isdigit() and int(f.stem) < oldest:
+            f.unlink()
+    snap.write_json("feed/latest.json", {"seq": delta["seq"], "timestamp": delta["timestamp"], "oldest": oldest})
+
+def load_data(data_file):
     data = get_initial_data()
     if data_file.exists():
+        # A corrupt data.json must stop the cycle, not be silently replaced with empty data
         try:
             loaded = json.loads(data_file.read_text(encoding="utf-8"))
-            data.update(loaded)
-        except: pass
+        except Exception as e:
+            raise RuntimeError(f"Unreadable {data_file}, skipping update: {e}")
+        data.update(loaded)
+    return data
+
+def aggregate_update(data, now, raw_entries):
+    """Folds one batch of fetched changesets for the hour containing `now` into `data` (in place) and the
+    chart series. Returns everything write_update needs, already serialised, so `data` can move on to
+    the next batch while this one is being written."""
+    prev_monthly = data.get("monthly_leaderboard", [])
+    prev_daily = data.get("daily_leaderboard", [])
 
-    raw_entries = fetch_recent_changesets()
     seen = set(data.get("seen_ids", []))
     new_entries = [e for e in raw_entries if e["id"] not in seen]
     for e in new_entries: seen.add(e["id"])
-    data["seen_ids"] = list(seen)[-5000:]
+    # Keep the highest ids: repeats come from the newest changesets, so those are the ones worth remembering
+    data["seen_ids"] = sorted(seen, key=int)[-SEEN_IDS_MAX:]
+
+    tindex = get_territory_index()
+    for e in new_entries: e["territory"] = tindex.locate(e["lat"], e["lon"])
+
+    # Optional content enrichment; older changesets that were open or over budget go first
+    backfilled = []
+    if CONTENT is not None:
+        pending = data.get("content_pending", [])
+        try:
+            left = changeset_content.enrich(pending + new_entries, CONTENT, budget=CONTENT_BUDGET, now=now)
+            backfilled = [p for p in pending if p.get("content")]
+            data["content_pending"] = [{k: e.get(k) for k in ("id", "uid", "created_at", "closed_at")} for e in left][-CONTENT_PENDING_MAX:]
+        except Exception as e:
+            print(f"Enrichment error: {e}")
+
+    if STORE is not None:
+        try: STORE.add(new_entries, fallback_hour=now)
+        except Exception as e: print(f"Store error: {e}")
 
     bucket_ts = now.replace(minute=0, second=0, microsecond=0)
     ts_str = bucket_ts.strftime("%Y-%m-%dT%H:%M:%SZ")
     data["last_month_update"] = now.strftime("%Y-%m-%dT%H:%M:%SZ")
 
-    cid = int(raw_entries[0]["id"]) if raw_entries else (data["hourly"][-1]["changeset_id"] if data["hourly"] else 0)
-
-    existing_hourly = next((item for item in data["hourly"] if item["timestamp"] == ts_str), None)
-    if existing_hourly:
-        existing_hourly["change"] += len(new_entries)
-        existing_hourly["changeset_id"] = cid
-    else:
-        data["hourly"].append({"timestamp": ts_str, "changeset_id": cid, "change": len(new_entries)})
-        data["hourly"] = data["hourly"][-720:]
+    hourly, daily, mappers = open_series(data)
+    hour = epoch_hour(bucket_ts)
+    last_hour, last = hourly.last()
+    cid = max((int(e["id"]) for e in raw_entries), default=last["changeset_id"] if last else 0)
+    # Where ingestion got to; catch_up compares this against the clock on the next start
+    prev_mark = data.get("watermark") or {}
+    data["watermark"] = {"time": data["last_month_update"], "max_id": max(cid, prev_mark.get("max_id", 0))}
+
+    # The open buckets' running counts are kept in data.json and put as absolute values, so the series only
+    # move in step with data.json: a batch whose write failed is fetched again next cycle (seen_ids didn't
+    # advance) and its bucket is overwritten with the same count, not added to twice
+    day = epoch_hour(bucket_ts.replace(hour=0))
+    counts = data.get("bucket_counts")
+    if counts is None:
+        # data.json from before bucket_counts: start from what the series hold
+        last_day, last_daily = daily.last()
+        counts = {"hour": last_hour, "hourly": last["change"] if last else 0,
+                  "day": last_day, "daily": last_daily["change"] if last_daily else 0}
+    hour_count = len(new_entries) + (counts["hourly"] if counts["hour"] == hour else 0)
+    day_count = len(new_entries) + (counts["daily"] if counts["day"] == day else 0)
+    data["bucket_counts"] = {"hour": hour, "hourly": hour_count, "day": day, "daily": day_count}
+    # The current bucket is always the series' last record, so this is O(1)
+    hourly.put(hour, changeset_id=cid, change=hour_count)
+    daily.put(day, changeset_id=cid, change=day_count)
 
     data.setdefault("monthly_store", []).extend(new_entries)
     this_month = now.strftime("%Y-%m")
@@ -560,13 +840,20 @@ def run_update(data_file, now):
     week_list = tally_users([e for e in data["monthly_store"] if e.get("ts", "") >= week_ago])
     full_month = tally_users(data["monthly_store"])
 
-    data.setdefault("daily_mapper_counts", []).append({"date": ts_str, "count": len(today_list)})
-    data.setdefault("weekly_mapper_counts", []).append({"date": ts_str, "count": len(week_list)})
-    data.setdefault("monthly_mapper_counts", []).append({"date": ts_str, "count": len(full_month)})
-
-    data["daily_mapper_counts"] = data["daily_mapper_counts"][-720:]
-    data["weekly_mapper_counts"] = data["weekly_mapper_counts"][-720:]
-    data["monthly_mapper_counts"] = data["monthly_mapper_counts"][-720:]
+    mappers.put(hour, daily=len(today_list), weekly=len(week_list), monthly=len(full_month))
+
+    # Chart JSON is exported from the binary series; only the trailing window goes into data.json
+    data["hourly"] = hourly.export(last=CHART_POINTS)
+    data["daily"] = daily.export(last=CHART_POINTS)
+    mapper_rows = mappers.export(time_key="date", last=CHART_POINTS)
+    for col, key in MAPPER_COLUMNS.items():
+        data[key] = [{"date": r["date"], "count": r[col]} for r in mapper_rows]
+    charts = {
+        "hourly.change": chart_points(hourly, "change"), "hourly.changeset_id": chart_points(hourly, "changeset_id"),
+        "daily.change": chart_points(daily, "change"), "daily.changeset_id": chart_points(daily, "changeset_id"),
+        **{f"mappers.{col}": chart_points(mappers, col) for col in MAPPER_COLUMNS},
+    }
+    for ser in (hourly, daily, mappers): ser.close()
 
     for u in full_month:
         u["d_today"] = next((x["objects"] for x in today_list if x["uid"] == u["uid"]), 0)
@@ -574,10 +861,45 @@ def run_update(data_file, now):
 
     data["monthly_leaderboard"] = full_month
     data["daily_leaderboard"] = today_list
+    data["territory_leaderboard"] = tally_territories(data["monthly_store"], tindex)
 
     data.setdefault("hourly_leaderboards", []).append({"timestamp": ts_str, "leaderboard": tally_users(new_entries)})
     data["hourly_leaderboards"] = data["hourly_leaderboards"][-48:]
-    data_file.write_text(json.dumps(data, indent=2), encoding="utf-8")
+
+    # Sequence-numbered delta so clients holding the previous snapshot can catch up cheaply
+    data["feed_seq"] = data.get("feed_seq", 0) + 1
+    delta = build_delta(data["feed_seq"], ts_str, data, prev_monthly, prev_daily, new_entries)
+
+    return {"now": now, "ts": ts_str, "data_json": json.dumps(data, indent=2), "deltas": [delta], "charts": charts,
+            "days": {now.strftime('%Y-%m-%d'): new_entries}, "new_entries": new_entries, "backfilled": backfilled}
+
+def merge_updates(updates):
+    """Folds consecutive aggregate_update results into one write. The last one's data.json and charts
+    already include the earlier batches; feed deltas, day-cache appends and per-user entries accumulate."""
+    if len(updates) == 1:
+        return updates[0]
+    merged = dict(updates[-1])
+    merged["deltas"] = [d for u in updates for d in u["deltas"]]
+    merged["days"] = {}
+    for u in updates:
+        for day, entries in u["days"].items():
+            merged["days"].setdefault(day, []).extend(entries)
+    merged["new_entries"] = [e for u in updates for e in u["new_entries"]]
+    merged["backfilled"] = [p for u in updates for p in u["backfilled"]]
+    return merged
+
+def write_update(data_file, update, rebuild_index=None):
+    """Writes one aggregated batch: data.json, feed, charts, the per-user files and users/index.json as one
+    snapshot generation, plus the day cache. rebuild_index defaults to "only if there were new changesets"."""
+    now, new_entries, backfilled = update["now"], update["new_entries"], update["backfilled"]
+    if rebuild_index is None:
+        rebuild_index = bool(new_entries)
+
+    snap = Snapshot(data_file.parent)
+    snap.write_text(data_file.name, update["data_json"])
+    for delta in update["deltas"]:
+        publish_delta(snap, data_file.parent, delta)
+    publish_chart_series(snap, update["charts"])
 
     try:
         CACHE_DIR.mkdir(parents=True, exist_ok=True)
@@ -585,70 +907,263 @@ def run_update(data_file, now):
     except Exception:
         pass
 
+    # Per-user files are published with data.json in the same generation. Each file is read once and
+    # written once, so several changesets (or backfills) for one user in a batch all land.
+    users_rel = os.path.relpath(USERS_DIR, data_file.parent)
+    ulists = {}
+    def user_list(uid):
+        if uid not in ulists:
+            userfile = USERS_DIR / f"{uid}.json"
+            ulists[uid] = []
+            if userfile.exists():
+                try: ulists[uid] = json.loads(userfile.read_text(encoding='utf-8'))
+                except: ulists[uid] = None  # unreadable: leave the published file alone
+        return ulists[uid]
+
+    # Content that arrived for changesets written in earlier cycles
+    by_uid = {}
+    for p in backfilled: by_uid.setdefault(str(p.get('uid') or 'unknown'), {})[p['id']] = p['content']
+    for uid, contents in by_uid.items():
+        ulist = user_list(uid)
+        if not ulist: continue
+        for entry in ulist:
+            if entry.get('id') in contents: entry['content'] = contents[entry['id']]
+
     if new_entries:
-        dayfile = CACHE_DIR / (now.strftime('%Y-%m-%d') + '.json')
-        daily = []
-        if dayfile.exists():
-            try: daily = json.loads(dayfile.read_text(encoding='utf-8'))
-            except: daily = []
-        daily.extend(new_entries)
-        dayfile.write_text(json.dumps(daily, indent=2), encoding='utf-8')
+        # Append-only for the current day; closed days are compacted into monthly archives (day_archive.py)
+        for day, entries in update["days"].items():
+            if entries:
+                day_archive.append_day(CACHE_DIR, day, entries)
 
         for e in new_entries:
             try:
                 uid = str(e.get('uid') or 'unknown')
-                userfile = USERS_DIR / f"{uid}.json"
-                ulist = []
-                if userfile.exists():
-                    try: ulist = json.loads(userfile.read_text(encoding='utf-8'))
-                    except: ulist = []
-                entry = {k: e.get(k) for k in ['id','created_at','closed_at','comment','created_by','source','changes_count','lat','lon']}
+                ulist = user_list(uid)
+                if ulist is None: continue
+                entry = {k: e.get(k) for k in ['id','created_at','closed_at','comment','created_by','source','changes_count','lat','lon','territory','content']}
                 entry['user'] = e.get('user')
                 entry['uid'] = uid
                 ulist.append(entry)
-                userfile.write_text(json.dumps(ulist, indent=2), encoding='utf-8')
             except Exception:
                 continue
 
+    for uid, ulist in ulists.items():
+        if ulist:
+            snap.write_json(f"{users_rel}/{uid}.json", ulist, indent=2)
+
+    if rebuild_index:
         try:
             index = []
-            for f in USERS_DIR.glob('*.json'):
-                if f.name == 'index.json': continue
+            # Users first seen in this batch only exist in the new generation so far
+            uids = {f.stem for f in USERS_DIR.glob('*.json') if f.name not in ('index.json', 'sessions.json')}
+            for uid in sorted(uids | {u for u, l in ulists.items() if l}):
                 try:
-                    uid = f.stem
-                    lst = json.loads(f.read_text(encoding='utf-8'))
+                    lst = ulists.get(uid) or json.loads((USERS_DIR / f"{uid}.json").read_text(encoding='utf-8'))
                     if not lst: continue
                     index.append({'uid': uid, 'user': lst[-1].get('user','')})
                 except:
                     continue
-            (USERS_DIR / 'index.json').write_text(json.dumps(index, indent=2), encoding='utf-8')
+            snap.write_json(f"{users_rel}/index.json", index, indent=2)
         except Exception:
             pass
 
+    snap.commit()
+
+def run_update(data_file, now, entries=None):
+    """One serial ingest cycle for the hour containing `now`. `entries` replaces the live fetch."""
+    data = load_data(data_file)
+    with profiling.stage("fetch"):
+        raw_entries = fetch_recent_changesets() if entries is None else entries
+    with profiling.stage("aggregate"):
+        update = aggregate_update(data, now, raw_entries)
+    with profiling.stage("write"):
+        write_update(data_file, update)
+
+def catch_up_batches(data_file, now):
+    """Yields (now, entries, None, True) batches for the hours between the stored watermark and `now` (e.g. after
+    downtime), one per hour so each lands in its own bucket; the writer coalesces them. Hours are fetched CATCHUP_WORKERS at a time in
+    windows of CATCHUP_WINDOW, oldest first; a failed fetch raises, leaving the watermark at the last good hour."""
+    if not data_file.exists():
+        return
+    try:
+        data = json.loads(data_file.read_text(encoding="utf-8"))
+    except Exception as e:
+        raise RuntimeError(f"Unreadable {data_file}, can't check for gaps: {e}")
+    mark = data.get("watermark") or {"time": data.get("last_month_update"), "max_id": 0}
+    if not mark.get("time"):
+        return
+
+    since = datetime.strptime(mark["time"], "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=timezone.utc)
+    current = now.replace(minute=0, second=0, microsecond=0)
+    if since >= current - timedelta(hours=1):
+        return  # last cycle ran in the previous hour or later: no gap
+
+    # Every hour from the watermark's up to (not including) the current one gets its own cycle
+    hours = []
+    h = since.replace(minute=0, second=0, microsecond=0)
+    while h < current:
+        hours.append(h)
+        h += timedelta(hours=1)
+
+    print(f"Gap detected: last ingest {mark['time']} (changeset {mark.get('max_id', 0)}), backfilling {len(hours)} hours...")
+    backfilled = 0
+    with ThreadPoolExecutor(max_workers=CATCHUP_WORKERS) as pool:
+        for i in range(0, len(hours), CATCHUP_WINDOW):
+            window = hours[i:i + CATCHUP_WINDOW]
+            starts = [max(h, since) for h in window]
+            results = pool.map(lambda se: fetch_changeset_window(*se), [(st, h + timedelta(hours=1)) for st, h in zip(starts, window)])
+            for h, entries in zip(window, results):
+                backfilled += len(entries)
+                yield h + timedelta(minutes=59, seconds=59), entries, None, True
+            print(f"  ✓ fetched through {window[-1].strftime('%Y-%m-%d %H:00')}")
+    print(f"✓ Catch-up fetched: {backfilled} changesets over {len(hours)} hours.")
+
+def catch_up(data_file, now):
+    """Serial catch-up: aggregates catch_up_batches one at a time, then writes them as one update."""
+    data = load_data(data_file)
+    updates = [aggregate_update(data, batch_now, entries) for batch_now, entries, _, _ in catch_up_batches(data_file, now)]
+    if updates:
+        write_update(data_file, merge_updates(updates))
+
+def live_batches(now):
+    yield now, fetch_recent_changesets(), None, False
+
+def replication_batches(data_file, now):
+    """Replication-mode batches: every sequence since the last one processed (up to replication.MAX_SEQUENCES),
+    grouped by the hour the changesets closed in. Earlier hours are coalesced into the current hour's write,
+    and the last batch saves the sequence once it is written."""
+    import replication
+    state_file = TARGET_DIR / "replication-state.json"
+    latest = replication.latest_sequence(REPLICATION)
+    last = replication.load_state(state_file)
+    if last is None:
+        last = latest - 1  # first run: start from the newest diff rather than replaying history
+    seqs = list(range(last + 1, latest + 1))[:replication.MAX_SEQUENCES]
+    entries = replication.fetch_sequences(REPLICATION, seqs, parse_changeset) if seqs else []
+    if seqs:
+        print(f"✓ Replication: sequences {seqs[0]}-{seqs[-1]} of {latest}, {len(entries)} closed changesets")
+
+    # Bucket by close hour, never before the last ingested hour (series only grow forward)
+    mark = None
+    if data_file.exists():
+        try: mark = (json.loads(data_file.read_text(encoding="utf-8")).get("watermark") or {}).get("time")
+        except Exception: pass
+    floor = datetime.strptime(mark, "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=timezone.utc) if mark else now
+    floor = floor.replace(minute=0, second=0, microsecond=0)
+    current = now.replace(minute=0, second=0, microsecond=0)
+    groups = {}
+    for e in entries:
+        closed = datetime.strptime(e["closed_at"], "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=timezone.utc)
+        groups.setdefault(min(max(closed.replace(minute=0, second=0), floor), current), []).append(e)
+
+    for hour in sorted(groups):
+        if hour < current:
+            yield hour + timedelta(minutes=59, seconds=59), groups[hour], None, True
+    yield now, groups.get(current, []), (lambda: replication.save_state(state_file, seqs[-1])) if seqs else None, False
+
+def ingest(data_file, now):
+    """One scheduled cycle as a fetch -> aggregate -> write pipeline (see pipeline.py): any catch-up hours,
+    then the live fetch (or the replication batches), with writes overlapping the next fetch. Catch-up hours
+    are aggregated one by one but written together with the batch that follows them."""
+    if REPLICATION:
+        source = replication_batches(data_file, now)
+    else:
+        # Gap hours first, so the live cycle doesn't move the watermark past them
+        source = itertools.chain(catch_up_batches(data_file, now), live_batches(now))
+
+    state = {"pending": []}
+    def aggregate(batch, backlog):
+        batch_now, entries, on_written, coalesce = batch
+        with profiling.stage("aggregate"):
+            if "data" not in state:
+                state["data"] = load_data(data_file)
+            return aggregate_update(state["data"], batch_now, entries), on_written, coalesce
+
+    def flush(backlog):
+        updates, state["pending"] = state["pending"], []
+        update = merge_updates([u for u, _ in updates])
+        # users/index.json is a full rescan; skip it while more batches are queued behind this one
+        state["index_dirty"] = state.get("index_dirty") or bool(update["new_entries"])
+        rebuild = state["index_dirty"] and backlog == 0
+        with profiling.stage("write"):
+            write_update(data_file, update, rebuild_index=rebuild)
+        if rebuild:
+            state["index_dirty"] = False
+        for _, on_written in updates:
+            if on_written:
+                on_written()
+        return update["ts"], len(update["new_entries"]), len(updates), backlog
+
+    def write(item, backlog):
+        update, on_written, coalesce = item
+        state["pending"].append((update, on_written))
+        # Catch-up hours go out together with the batch after them (or a day's worth at a time)
+        if coalesce and len(state["pending"]) < CATCHUP_WINDOW:
+            return None
+        return flush(backlog)
+
+    def written(result, latency):
+        if result is None:
+            return
+        ts_str, n, hours, backlog = result
+        print(f"  ✓ {ts_str}: {n} new changesets from {hours} hour(s) written ({latency:.1f}s after fetch, {backlog} queued)")
+
+    try:
+        asyncio.run(pipeline.run(("fetch", profiling.profiled_iter("fetch", source)), [("aggregate", aggregate), ("write", write)], on_item=written))
+    finally:
+        # A fetch that failed mid catch-up still leaves the hours before it aggregated: write those
+        if state["pending"]:
+            written(flush(0), 0.0)
+
+    # Days that are over get folded into the monthly archives, which changeset_index then re-indexes
+    with profiling.stage("compact"):
+        try:
+            day_archive.compact(CACHE_DIR, now.strftime('%Y-%m-%d'))
+            changeset_index.refresh(CACHE_DIR)
+        except Exception as e:
+            print(f"❌ Day cache compaction failed: {e}")
+
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument('--once', action='store_true', help='Run a single update and exit (good for testing)')
     parser.add_argument('--outdir', type=str, default=None, help='Override output directory (e.g. ./site)')
+    parser.add_argument('--store', type=str, default=None, help='Also record changesets in this SQLite file (for query_server.py)')
+    parser.add_argument('--replication', type=str, default=None, help='Ingest from a changeset replication feed (URL or local directory) instead of polling')
+    parser.add_argument('--enrich', action='store_true', help='Download closed changesets for per-type create/modify/delete counts')
+    parser.add_argument('--enrich-budget', type=int, default=changeset_content.BUDGET, help='Max changeset downloads per cycle')
+    profiling.add_argument(parser)
     args = parser.parse_args()
 
+    global STORE, CONTENT, CONTENT_BUDGET, REPLICATION
+    REPLICATION = args.replication
+    if args.store:
+        STORE = ChangesetStore(args.store)
+
     if args.once and not args.outdir:
         args.outdir = str(Path(__file__).parent.joinpath('site').resolve())
 
     if args.outdir:
         out = Path(args.outdir).resolve()
-        global TARGET_DIR, CACHE_DIR, USERS_DIR
+        global TARGET_DIR, CACHE_DIR, USERS_DIR, GEOM_DIR, SERIES_DIR
         TARGET_DIR = out
         CACHE_DIR = TARGET_DIR / "user_cache"
         USERS_DIR = TARGET_DIR / "users"
+        GEOM_DIR = TARGET_DIR / "tdata" / "territory-geom"
+        SERIES_DIR = TARGET_DIR / "series"
 
     TARGET_DIR.mkdir(parents=True, exist_ok=True)
+    if args.enrich:
+        CONTENT = changeset_content.ContentCache(TARGET_DIR / "changeset_content")
+        CONTENT_BUDGET = args.enrich_budget
 
     final_index = INDEX_HTML.replace("{{GOOGLE_BLOCK}}", GOOGLE_BLOCK).replace("{{STYLE_BLOCK}}", STYLE_BLOCK).replace("{{NAV_BAR}}", NAV_BAR)
     final_leaderboard = LEADERBOARD_HTML.replace("{{GOOGLE_BLOCK}}", GOOGLE_BLOCK).replace("{{STYLE_BLOCK}}", STYLE_BLOCK).replace("{{NAV_BAR}}", NAV_BAR)
 
     pages = {"index.html": final_index, "leaderboards.html": final_leaderboard, "version.html": VERSION_HTML}
+    snap = Snapshot(TARGET_DIR)
     for f, c in pages.items():
-        (TARGET_DIR / f).write_text(c, encoding='utf-8')
+        snap.write_text(f, c)
+    snap.commit()
 
     data_file = TARGET_DIR / "data.json"
 
@@ -663,38 +1178,45 @@ def main():
 
     print(f"Starting OGFStats v{VERSION}...")
 
+    # full profiles the first cycle only; sample mode is cheap enough to keep on
+    profile_mode = args.profile or profiling.mode_from_env()
+
     if args.once:
+        profiling.start(profile_mode, "ogfstats")
         now = datetime.now(timezone.utc)
-        run_update(data_file, now)
+        ingest(data_file, now)
         try:
             import generate_user_pages
-            old_argv = sys.argv
-            sys.argv = [sys.argv[0], '--outdir', str(TARGET_DIR)]
-            generate_user_pages.main()
-            sys.argv = old_argv
+            generate_user_pages.main(['--outdir', str(TARGET_DIR)])
             print("✓ user pages generated (one-shot)")
         except Exception as e:
             print(f"Error generating user pages: {e}")
+        profiling.finish()
         return
 
     while True:
+        profiling.start(profile_mode, "ogfstats")
         try:
             now = datetime.now(timezone.utc)
-            run_update(data_file, now)
+            ingest(data_file, now)
 
             # FIX: Ensure checking "last_daily_run_day" tracks execution safely across machine restarts
             current_day = now.strftime("%Y-%m-%d")
             if now.hour == 0 and last_ts_run_day != current_day:
                 print(f"Midnight hour detected ({current_day} 00:00). Running ts.py...")
+                # Once the full-profile cycle is over, keep OGF_PROFILE from switching it back on in the children
+                child_profile = ['--profile', profiling.OFF] if profile_mode == profiling.OFF else []
                 try:
-                    subprocess.run([sys.executable, "ts.py"], check=True)
+                    # ts.py is a separate process; it profiles itself when OGF_PROFILE is set
+                    subprocess.run([sys.executable, "ts.py"] + child_profile, check=True)
                     print("✓ ts.py completed successfully.")
                 except Exception as e:
                     print(f"❌ Error running ts.py: {e}")
 
                 try:
                     import generate_user_pages
-                    generate_user_pages.main()
+                    # Its own argv: ogfstats' flags (--store, --enrich, ...) would make its parser exit
+                    generate_user_pages.main(['--outdir', str(TARGET_DIR)] + child_profile)
                     print("✓ generate_user_pages completed successfully.")
                 except Exception as e:
                     print(f"❌ Error running generate_user_pages: {e}")
@@ -705,12 +1227,17 @@ def main():
                     try:
                         f_data = json.loads(data_file.read_text(encoding="utf-8"))
                         f_data["last_daily_run_day"] = current_day
-                        data_file.write_text(json.dumps(f_data, indent=2), encoding="utf-8")
+                        snap = Snapshot(TARGET_DIR)
+                        snap.write_json(data_file.name, f_data, indent=2)
+                        snap.commit()
                     except:
                         pass
 
         except Exception as e:
             print(f"Critical Loop error: {e}")
+        profiling.finish()
+        if profile_mode == "full":
+            profile_mode = profiling.OFF
 
         now = datetime.now(timezone.utc)
         seconds_until_next_hour = 3600 - (now.minute * 60 + now.second) + 5
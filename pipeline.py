@@ -0,0 +1,113 @@
+import asyncio
+import time
+
+# Staged ingestion: a source iterator feeds a chain of stage functions through bounded
+# asyncio queues. Every stage runs its (blocking) work in the default thread executor,
+# so while one batch is being written the next is already aggregated and the one after
+# that fetched. Stages process their items one at a time and in order.
+#
+# Each stage function is called as fn(item, backlog) where backlog is how many more items
+# are already waiting for that stage (lets a writer coalesce work it would redo anyway).
+
+QUEUE_SIZE = 4
+_DONE = object()
+
+
+class _Queue(asyncio.Queue):
+    # qsize() would count the end marker too; `waiting` is just the real items
+    waiting = 0
+
+    async def put_item(self, item):
+        self.waiting += 1
+        await self.put(item)
+
+    async def get_item(self):
+        got = await self.get()
+        if got is not _DONE:
+            self.waiting -= 1
+        return got
+
+
+class StageStats:
+    def __init__(self, name):
+        self.name = name
+        self.items = 0
+        self.busy = 0.0
+        self.max_depth = 0
+        self.wait_total = 0.0
+        self.max_wait = 0.0
+
+    def record(self, depth, wait, took):
+        self.items += 1
+        self.busy += took
+        self.max_depth = max(self.max_depth, depth)
+        self.wait_total += wait
+        self.max_wait = max(self.max_wait, wait)
+
+    def summary(self):
+        avg_wait = self.wait_total / self.items if self.items else 0.0
+        return (f"{self.name}: {self.items} items, busy {self.busy:.1f}s, "
+                f"max queue {self.max_depth}, wait avg {avg_wait:.1f}s / max {self.max_wait:.1f}s")
+
+
+async def _source(it, out, stats, errors):
+    it = iter(it)
+    try:
+        while True:
+            t0 = time.monotonic()
+            item = await asyncio.to_thread(next, it, _DONE)
+            if item is _DONE:
+                break
+            stats.record(out.waiting, 0.0, time.monotonic() - t0)
+            await out.put_item((time.monotonic(), time.monotonic(), item))
+    except Exception as e:
+        # Let what was already produced drain through the other stages, then re-raise
+        errors.append(e)
+    await out.put(_DONE)
+
+
+async def _stage(fn, inq, out, stats, on_item):
+    while True:
+        got = await inq.get_item()
+        if got is _DONE:
+            break
+        started, queued, item = got
+        wait = time.monotonic() - queued
+        backlog = inq.waiting
+        t0 = time.monotonic()
+        result = await asyncio.to_thread(fn, item, backlog)
+        stats.record(backlog, wait, time.monotonic() - t0)
+        if out is not None:
+            await out.put_item((started, time.monotonic(), result))
+        elif on_item:
+            on_item(result, time.monotonic() - started)
+    if out is not None:
+        await out.put(_DONE)
+
+
+async def run(source, stages, queue_size=QUEUE_SIZE, on_item=None, verbose=True):
+    """Runs `source` (name, iterable) through `stages` [(name, fn), ...]. on_item(result, latency) is
+    called with each result of the last stage. Returns the per-stage StageStats."""
+    names = [source[0]] + [name for name, _ in stages]
+    stats = [StageStats(n) for n in names]
+    queues = [_Queue(maxsize=queue_size) for _ in stages]
+    errors = []
+
+    tasks = [asyncio.create_task(_source(source[1], queues[0], stats[0], errors))]
+    for i, (_, fn) in enumerate(stages):
+        out = queues[i + 1] if i + 1 < len(stages) else None
+        tasks.append(asyncio.create_task(_stage(fn, queues[i], out, stats[i + 1], on_item)))
+
+    done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+    for t in pending:
+        t.cancel()
+    for t in done:
+        if t.exception() is not None:
+            raise t.exception()
+
+    if verbose:
+        for s in stats:
+            print(f"  [{s.summary()}]")
+    if errors:
+        raise errors[0]
+    return stats
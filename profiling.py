@@ -0,0 +1,212 @@
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+
+# Opt-in profiling for one cycle of an entry point (ogfstats.py, generate_user_pages.py, ts.py).
+# Code marks its phases with `with profiling.stage("name"):`; that's a no-op unless profiling
+# was started with --profile or the OGF_PROFILE environment variable.
+#
+# Modes:
+#   sample  a background thread records every thread's stack every SAMPLE_INTERVAL seconds.
+#           Cheap enough to leave on; writes a collapsed-stack file (flamegraph.pl / speedscope).
+#   full    sampling plus cProfile and tracemalloc per stage: one .pstats file per stage and
+#           the top allocation sites. Noticeably slower.
+#
+# Output goes to OGF_PROFILE_DIR (default ./profiles) as <label>-<time>.*; the newest KEEP
+# cycles are kept.
+
+MODES = ("sample", "full")
+OFF = "off"  # explicitly no profiling, even with OGF_PROFILE set (None means "not given")
+SAMPLE_INTERVAL = 0.01
+TOP = 10
+KEEP = 48
+
+_session = None
+
+# Allocation sites inside the profilers themselves aren't interesting
+_ALLOC_IGNORE = [tracemalloc.Filter(False, f) for f in (tracemalloc.__file__, cProfile.__file__, pstats.__file__, __file__)] + \
+                [tracemalloc.Filter(False, "<frozen importlib._bootstrap*>")]
+
+
+def mode_from_env():
+    value = os.environ.get("OGF_PROFILE", "").strip().lower()
+    if value in ("1", "true", "yes"):
+        return "full"
+    return value if value in MODES + (OFF,) else None
+
+
+def add_argument(parser):
+    parser.add_argument('--profile', nargs='?', const='full', choices=MODES + (OFF,), default=None,
+                        help='Profile this run (full: cProfile + tracemalloc per stage; sample: low-overhead stack sampling; off: not even if OGF_PROFILE is set). Also OGF_PROFILE=full|sample')
+
+
+class _Stage:
+    def __init__(self):
+        self.wall = 0.0
+        self.calls = 0
+        self.profile = None
+        self.alloc = Counter()
+
+
+class Session:
+    def __init__(self, mode, label, out_dir):
+        self.mode = mode
+        self.label = label
+        self.out_dir = Path(out_dir)
+        self.stamp = time.strftime("%Y%m%dT%H%M%S", time.gmtime())
+        self.stages = {}
+        self.lock = threading.Lock()
+        self.samples = Counter()
+        self.started = time.perf_counter()
+        self._stop = threading.Event()
+        self._sampler = threading.Thread(target=self._sample, name="ogf-profile-sampler", daemon=True)
+        if mode == "full" and not tracemalloc.is_tracing():
+            tracemalloc.start(10)
+        self._sampler.start()
+
+    def _sample(self):
+        me = threading.get_ident()
+        while not self._stop.wait(SAMPLE_INTERVAL):
+            stage_of = {t.ident: getattr(t, "_ogf_stage", None) for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stage = stage_of.get(ident)
+                key = ";".join(([f"[{stage}]"] if stage else []) + stack[::-1])
+                self.samples[key] += 1
+
+    def get(self, name):
+        with self.lock:
+            return self.stages.setdefault(name, _Stage())
+
+    @contextmanager
+    def stage(self, name):
+        st = self.get(name)
+        thread = threading.current_thread()
+        outer = getattr(thread, "_ogf_stage", None)
+        thread._ogf_stage = name
+        prof = before = None
+        # Nested stages only count wall time; their cost already shows up in the outer stage's profile
+        if self.mode == "full" and outer is None:
+            prof = cProfile.Profile()
+            try:
+                prof.enable()
+            except ValueError:
+                prof = None  # Python 3.12+: only one cProfile may be active at a time
+            before = tracemalloc.take_snapshot().filter_traces(_ALLOC_IGNORE)
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            took = time.perf_counter() - t0
+            if prof is not None:
+                prof.disable()
+            thread._ogf_stage = outer
+            with self.lock:
+                st.wall += took
+                st.calls += 1
+                if prof is not None:
+                    if st.profile is None:
+                        st.profile = pstats.Stats(prof)
+                    else:
+                        st.profile.add(prof)
+            if before is not None:
+                diff = tracemalloc.take_snapshot().filter_traces(_ALLOC_IGNORE).compare_to(before, "lineno")
+                with self.lock:
+                    for d in diff[:TOP * 2]:
+                        frame = d.traceback[0]
+                        st.alloc[f"{frame.filename}:{frame.lineno}"] += d.size_diff
+
+    def finish(self):
+        self._stop.set()
+        self._sampler.join()
+        total = time.perf_counter() - self.started
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        base = self.out_dir / f"{self.label}-{self.stamp}"
+
+        with open(f"{base}.collapsed", "w", encoding="utf-8") as f:
+            for stack, n in self.samples.most_common():
+                f.write(f"{stack} {n}\n")
+
+        print(f"Profile ({self.mode}) of {self.label}: {total:.2f}s, {sum(self.samples.values())} samples -> {base}.*")
+        for name, st in sorted(self.stages.items(), key=lambda kv: -kv[1].wall):
+            print(f"  {name:<16} {st.wall:8.2f}s  x{st.calls}")
+            if st.profile is not None:
+                st.profile.dump_stats(f"{base}-{name}.pstats")
+                out = io.StringIO()
+                pstats.Stats(f"{base}-{name}.pstats", stream=out).sort_stats("cumulative").print_stats(5)
+                for line in out.getvalue().splitlines():
+                    if line.strip() and line.strip()[0].isdigit():
+                        print(f"      {line.strip()}")
+            for site, size in st.alloc.most_common(3):
+                if size > 0:
+                    print(f"      +{size / 1024:.0f} KiB  {site}")
+
+        if self.mode == "full":
+            tracemalloc.stop()
+        self._prune()
+
+    def _prune(self):
+        runs = sorted(self.out_dir.glob(f"{self.label}-*.collapsed"))
+        for old in runs[:-KEEP]:
+            stamp = old.name[:-len(".collapsed")]
+            for f in self.out_dir.glob(f"{stamp}*"):
+                try: f.unlink()
+                except OSError: pass
+
+
+def start(mode=None, label="run", out_dir=None):
+    """Starts a session if `mode` (or, when mode is None, OGF_PROFILE) asks for one and none is running.
+    Returns True if it started one; the caller that started it is the one that calls finish()."""
+    global _session
+    if mode is None:
+        mode = mode_from_env()
+    if mode in (None, OFF) or _session is not None:
+        return False
+    _session = Session(mode, label, out_dir or os.environ.get("OGF_PROFILE_DIR", "profiles"))
+    return True
+
+
+def finish():
+    global _session
+    if _session is None:
+        return
+    session, _session = _session, None
+    try:
+        session.finish()
+    except Exception as e:
+        print(f"❌ Profile dump failed: {e}")
+
+
+def stage(name):
+    return _session.stage(name) if _session is not None else _null()
+
+
+@contextmanager
+def _null():
+    yield
+
+
+def profiled_iter(name, it):
+    """Wraps an iterator so the work behind each next() is attributed to stage `name`."""
+    it = iter(it)
+    while True:
+        with stage(name):
+            try:
+                item = next(it)
+            except StopIteration:
+                return
+        yield item
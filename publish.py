@@ -0,0 +1,132 @@
+import json
+import os
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+# Atomic publishing for generated files.
+#
+# atomic_write_* write to a temp file in the target directory and rename it over the
+# destination, so readers see either the old or the new file, never a partial one.
+#
+# Snapshot groups one cycle's outputs into <root>/snapshots/<generation>/ and publishes
+# them all at once by flipping the <root>/current symlink. The public paths (e.g.
+# <root>/data.json) are symlinks through `current`, so a reader following one always
+# lands in a single, complete generation. Files a cycle didn't rewrite are hard links to the
+# previous generation's, so each generation only costs the space of what changed.
+
+KEEP_GENERATIONS = 5
+
+
+def atomic_write_bytes(path, data: bytes):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, path)
+    except BaseException:
+        try: os.unlink(tmp)
+        except OSError: pass
+        raise
+
+
+def atomic_write_text(path, text: str, encoding="utf-8"):
+    atomic_write_bytes(path, text.encode(encoding))
+
+
+def atomic_write_json(path, obj, **dumps_kwargs):
+    atomic_write_text(path, json.dumps(obj, **dumps_kwargs))
+
+
+def atomic_symlink(target, link):
+    """Points `link` at `target`, replacing whatever is there (file or symlink) in one rename."""
+    link = Path(link)
+    tmp = link.with_name(f".{link.name}.{os.getpid()}.lnk")
+    try: os.unlink(tmp)
+    except OSError: pass
+    os.symlink(target, tmp)
+    os.replace(tmp, link)
+
+
+class Snapshot:
+    def __init__(self, root, keep=KEEP_GENERATIONS):
+        self.root = Path(root)
+        self.keep = keep
+        self.generation = time.strftime("%Y%m%dT%H%M%S", time.gmtime()) + f"-{time.time_ns() % 1_000_000_000:09d}"
+        self.dir = self.root / "snapshots" / self.generation
+        self.names = []
+        self.dropped = []
+
+    def path(self, name) -> Path:
+        """Where to write `name` (relative to root) inside this generation."""
+        self.names.append(name)
+        p = self.dir / name
+        p.parent.mkdir(parents=True, exist_ok=True)
+        return p
+
+    def write_text(self, name, text: str):
+        atomic_write_text(self.path(name), text)
+
+    def write_json(self, name, obj, **dumps_kwargs):
+        atomic_write_json(self.path(name), obj, **dumps_kwargs)
+
+    def carry(self, name):
+        """Hard-links `name` from the currently published generation so the new one stays complete.
+        Generation files are never modified in place (every write renames a new file over the old
+        one), so sharing the inode is safe. Copies only when the link fails (e.g. across filesystems)."""
+        src = self.root / "current" / name
+        if not src.exists():
+            return
+        dst = self.path(name)
+        try:
+            os.link(src, dst)
+        except OSError:
+            shutil.copy2(src, dst)
+
+    def drop(self, prefix):
+        """Marks `prefix` (a directory relative to root) as fully rewritten by this generation: files
+        under it that weren't written are not carried over, and their public links are removed."""
+        self.dropped.append(prefix.rstrip("/") + "/")
+
+    def commit(self):
+        # Anything the previous generation published but this one didn't write is carried over
+        current = self.root / "current"
+        stale = []
+        if current.exists():
+            written = set(self.names)
+            for f in current.rglob("*"):
+                name = str(f.relative_to(current))
+                if not f.is_file() or name in written:
+                    continue
+                if any(name.startswith(p) for p in self.dropped):
+                    stale.append(name)
+                else:
+                    self.carry(name)
+
+        atomic_symlink(os.path.join("snapshots", self.generation), current)
+
+        # Stable public paths: <root>/<name> -> current/<name> (relative, so the tree can move)
+        for name in self.names:
+            link = self.root / name
+            target = os.path.relpath(current / name, link.parent)
+            if not (link.is_symlink() and os.readlink(link) == target):
+                link.parent.mkdir(parents=True, exist_ok=True)
+                atomic_symlink(target, link)
+        for name in stale:
+            link = self.root / name
+            if link.is_symlink():
+                link.unlink()
+
+        self.prune()
+
+    def prune(self):
+        gens = sorted(p for p in (self.root / "snapshots").iterdir() if p.is_dir())
+        for old in gens[:-self.keep]:
+            if old.name != self.generation:
+                shutil.rmtree(old, ignore_errors=True)
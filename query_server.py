@@ -0,0 +1,161 @@
+import argparse
+import json
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+from changeset_store import ChangesetStore, BUCKETS, parse_ts
+
+# JSON query API over the SQLite changeset store (see changeset_store.py):
+#   /api/leaderboard?start=&end=&limit=     top mappers for any time range
+#   /api/user/<uid>?start=&end=&bucket=     one user's changesets/objects per hour or day
+#   /api/totals?start=&end=&bucket=         site-wide changesets/objects/mappers
+#   /api/editors?start=&end=                editor share
+# start/end are ISO timestamps (default: the last 24 hours), rounded down to the hour.
+
+CACHE_SIZE = 256
+MAX_LIMIT = 1000
+
+
+class QueryError(ValueError):
+    pass
+
+
+class ResponseCache:
+    """LRU of encoded responses, dropped wholesale when the store's generation moves (new ingest)."""
+
+    def __init__(self, size=CACHE_SIZE):
+        self.size = size
+        self.generation = None
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, generation):
+        with self.lock:
+            if generation != self.generation:
+                self.items.clear()
+                self.generation = generation
+                return None
+            body = self.items.get(key)
+            if body is not None:
+                self.items.move_to_end(key)
+            return body
+
+    def put(self, key, generation, body):
+        with self.lock:
+            if generation != self.generation:
+                return
+            self.items[key] = body
+            if len(self.items) > self.size:
+                self.items.popitem(last=False)
+
+
+def _hour(value, default):
+    if not value:
+        return default
+    try:
+        dt = parse_ts(value if "T" in value else value + "T00:00:00Z")
+    except ValueError:
+        raise QueryError(f"bad timestamp: {value}")
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.astimezone(timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+
+def normalize(path, qs):
+    """Turns a request into a canonical (endpoint, args) tuple used both for dispatch and as the cache key."""
+    now = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+    get = lambda k: (qs.get(k) or [None])[0]
+    end = _hour(get("end"), now)
+    start = _hour(get("start"), end - timedelta(hours=24))
+    if start >= end:
+        raise QueryError("start must be before end")
+    bucket = get("bucket") or "day"
+    if bucket not in BUCKETS:
+        raise QueryError(f"bucket must be one of {', '.join(BUCKETS)}")
+
+    parts = [p for p in path.split("/") if p]
+    if parts[:1] != ["api"] or len(parts) < 2:
+        raise QueryError("unknown endpoint")
+    endpoint = parts[1]
+    if endpoint == "leaderboard":
+        try:
+            limit = int(get("limit") or 100)
+        except ValueError:
+            raise QueryError("limit must be an integer")
+        if limit < 1:
+            raise QueryError("limit must be at least 1")
+        limit = min(MAX_LIMIT, limit)
+        return ("leaderboard", start, end, limit)
+    if endpoint == "user" and len(parts) == 3:
+        return ("user", parts[2], start, end, bucket)
+    if endpoint == "totals":
+        return ("totals", start, end, bucket)
+    if endpoint == "editors":
+        return ("editors", start, end)
+    raise QueryError("unknown endpoint")
+
+
+def run_query(store, key):
+    kind = key[0]
+    if kind == "leaderboard":
+        _, start, end, limit = key
+        result = store.leaderboard(start, end, limit)
+    elif kind == "user":
+        _, uid, start, end, bucket = key
+        result = store.user_series(uid, start, end, bucket)
+    elif kind == "totals":
+        _, start, end, bucket = key
+        result = store.totals(start, end, bucket)
+    else:
+        _, start, end = key
+        result = store.editor_share(start, end)
+    fmt = lambda dt: dt.strftime("%Y-%m-%dT%H:%M:%SZ")
+    return {"query": [fmt(k) if isinstance(k, datetime) else k for k in key], "result": result}
+
+
+def make_handler(store, cache):
+    class QueryHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            try:
+                key = normalize(url.path, parse_qs(url.query))
+            except QueryError as e:
+                return self.send_json(400, json.dumps({"error": str(e)}).encode("utf-8"))
+            try:
+                generation = store.generation()
+                body = cache.get(key, generation)
+                if body is None:
+                    body = json.dumps(run_query(store, key), separators=(",", ":")).encode("utf-8")
+                    cache.put(key, generation, body)
+                self.send_json(200, body)
+            finally:
+                store.close()  # handler threads are per-request; don't leak their connections
+
+        def send_json(self, status, body):
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("Access-Control-Allow-Origin", "*")
+            self.end_headers()
+            self.wfile.write(body)
+
+    return QueryHandler
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--db", type=str, required=True, help="SQLite changeset store (ogfstats.py --store / ogfstats-local.py --sqlite)")
+    parser.add_argument("--port", type=int, default=8002)
+    args = parser.parse_args()
+
+    store = ChangesetStore(args.db)
+    server = ThreadingHTTPServer(("0.0.0.0", args.port), make_handler(store, ResponseCache()))
+    print(f"OGFStats query API serving at http://localhost:{server.server_port}/api/")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
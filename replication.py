@@ -0,0 +1,84 @@
+import gzip
+import json
+import re
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from urllib.request import urlopen, Request
+import xml.etree.ElementTree as ET
+
+from publish import atomic_write_json
+
+# OSM-style changeset replication: <base>/state.yaml holds the latest sequence number and
+# <base>/AAA/BBB/CCC.osm.gz holds the changesets created or updated in that interval.
+# <base> is either a URL or a local directory laid out the same way (handy for testing).
+#
+# A changeset shows up again in later diffs every time it changes; only closed ones are
+# returned so each is counted once, with its final changes count.
+
+USER_AGENT = "ogf-stats-script"
+WORKERS = 8
+MAX_SEQUENCES = 1440  # per cycle: one day of minutely diffs
+
+
+def is_url(base):
+    return "://" in str(base)
+
+
+def sequence_path(seq):
+    s = f"{int(seq):09d}"
+    return f"{s[0:3]}/{s[3:6]}/{s[6:9]}.osm.gz"
+
+
+def open_resource(base, rel):
+    if is_url(base):
+        req = Request(f"{str(base).rstrip('/')}/{rel}", headers={"User-Agent": USER_AGENT})
+        return urlopen(req, timeout=60)
+    return open(Path(base) / rel, "rb")
+
+
+def latest_sequence(base):
+    with open_resource(base, "state.yaml") as f:
+        text = f.read().decode("utf-8")
+    m = re.search(r"^sequence:\s*(\d+)", text, re.M)
+    if not m:
+        raise ValueError(f"No sequence in {base}/state.yaml")
+    return int(m.group(1))
+
+
+def iter_diff(stream, parse):
+    """Yields parse(<changeset> element) for every closed changeset in a gzipped diff, streaming."""
+    context = ET.iterparse(gzip.GzipFile(fileobj=stream), events=("start", "end"))
+    _, root = next(context)
+    for event, el in context:
+        if event == "end" and el.tag == "changeset":
+            if el.get("open") != "true" and el.get("closed_at"):
+                yield parse(el)
+            root.clear()
+
+
+def read_sequence(base, seq, parse):
+    with open_resource(base, sequence_path(seq)) as f:
+        return list(iter_diff(f, parse))
+
+
+def fetch_sequences(base, seqs, parse, workers=WORKERS):
+    """Changesets from the given sequences, downloaded in parallel and returned in sequence order.
+    A later version of a changeset replaces an earlier one."""
+    by_id = {}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for entries in pool.map(lambda s: read_sequence(base, s, parse), seqs):
+            for e in entries:
+                by_id.pop(e["id"], None)
+                by_id[e["id"]] = e
+    return list(by_id.values())
+
+
+def load_state(path):
+    try:
+        return json.loads(Path(path).read_text(encoding="utf-8")).get("sequence")
+    except Exception:
+        return None
+
+
+def save_state(path, seq):
+    atomic_write_json(path, {"sequence": seq})
@@ -0,0 +1,216 @@
+import mmap
+import os
+import struct
+import sys
+from datetime import datetime, timezone
+
+# Fixed-width binary time series, accessed through mmap.
+#
+# Layout: a header (magic, column count, record count, column names) followed by
+# records of one int32 epoch-hour key and one int64 per column. Keys only ever
+# grow, so the current bucket is always the last record: reading, updating or
+# appending it is O(1), and any other bucket is a binary search away. The file
+# grows in doubling steps and is never truncated, so history is unbounded.
+
+MAGIC = b"OGFSER01"
+NAME_WIDTH = 16
+GROW_MIN = 1024  # records
+
+
+def epoch_hour(dt: datetime) -> int:
+    return int(dt.timestamp()) // 3600
+
+
+def hour_iso(hour: int) -> str:
+    return datetime.fromtimestamp(hour * 3600, timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+class HourlySeries:
+    def __init__(self, path, columns):
+        self.path = str(path)
+        self.columns = list(columns)
+        self.record = struct.Struct("<i" + "q" * len(self.columns))
+        self.header_size = 24 + NAME_WIDTH * len(self.columns)
+
+        if not os.path.exists(self.path) or os.path.getsize(self.path) == 0:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path, "wb") as f:
+                names = b"".join(c.encode("ascii")[:NAME_WIDTH].ljust(NAME_WIDTH, b"\0") for c in self.columns)
+                f.write(MAGIC + struct.pack("<IIQ", len(self.columns), 0, 0) + names)
+                f.truncate(self.header_size + GROW_MIN * self.record.size)
+
+        self.file = open(self.path, "r+b")
+        self.map = mmap.mmap(self.file.fileno(), 0)
+        magic, ncols = self.map[:8], struct.unpack_from("<I", self.map, 8)[0]
+        stored = [self.map[24 + i * NAME_WIDTH:24 + (i + 1) * NAME_WIDTH].rstrip(b"\0").decode("ascii") for i in range(ncols)]
+        if magic != MAGIC or stored != [c[:NAME_WIDTH] for c in self.columns]:
+            self.close()
+            raise ValueError(f"{self.path}: not a series with columns {self.columns}")
+
+    # --- header ---
+    def __len__(self):
+        return struct.unpack_from("<Q", self.map, 16)[0]
+
+    def _set_len(self, n):
+        struct.pack_into("<Q", self.map, 16, n)
+
+    def _capacity(self):
+        return (len(self.map) - self.header_size) // self.record.size
+
+    def _offset(self, i):
+        return self.header_size + i * self.record.size
+
+    def _grow(self):
+        new_cap = max(GROW_MIN, self._capacity() * 2)
+        self.map.flush()
+        self.map.close()
+        self.file.truncate(self.header_size + new_cap * self.record.size)
+        self.map = mmap.mmap(self.file.fileno(), 0)
+
+    # --- records ---
+    def get(self, i):
+        """(hour, {column: value}) for record i (negative indexes count from the end)."""
+        n = len(self)
+        if i < 0:
+            i += n
+        if not 0 <= i < n:
+            raise IndexError(i)
+        hour, *values = self.record.unpack_from(self.map, self._offset(i))
+        return hour, dict(zip(self.columns, values))
+
+    def last(self):
+        return self.get(-1) if len(self) else (None, None)
+
+    def find(self, hour):
+        """Index of the record for `hour`, or None."""
+        lo, hi = 0, len(self)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            key = struct.unpack_from("<i", self.map, self._offset(mid))[0]
+            if key < hour:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < len(self) and struct.unpack_from("<i", self.map, self._offset(lo))[0] == hour:
+            return lo
+        return None
+
+    def put(self, hour, **values):
+        """Sets the bucket for `hour`: appends a new last bucket, or overwrites an existing one in place.
+        Columns not given keep their stored value (0 for a new bucket)."""
+        n = len(self)
+        last_hour = struct.unpack_from("<i", self.map, self._offset(n - 1))[0] if n else None
+        if last_hour is None or hour > last_hour:
+            if n >= self._capacity():
+                self._grow()
+            current = dict.fromkeys(self.columns, 0)
+            i = n
+        else:
+            i = n - 1 if hour == last_hour else self.find(hour)
+            if i is None:
+                raise ValueError(f"{self.path}: cannot insert hour {hour} before the last bucket {last_hour}")
+            current = self.get(i)[1]
+        current.update(values)
+        self.record.pack_into(self.map, self._offset(i), hour, *(int(current[c]) for c in self.columns))
+        if i == n:
+            self._set_len(n + 1)
+
+    def iter_range(self, start_hour=None, end_hour=None):
+        """Yields (hour, {column: value}) for start_hour <= hour < end_hour."""
+        n = len(self)
+        i = 0 if start_hour is None else self._lower_bound(start_hour)
+        while i < n:
+            hour, values = self.get(i)
+            if end_hour is not None and hour >= end_hour:
+                break
+            yield hour, values
+            i += 1
+
+    def _lower_bound(self, hour):
+        lo, hi = 0, len(self)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if struct.unpack_from("<i", self.map, self._offset(mid))[0] < hour:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def export(self, time_key="timestamp", last=None, step=1, start_hour=None, end_hour=None):
+        """Chart JSON rows: [{time_key: iso, column: value, ...}]. `last` keeps only the trailing N buckets,
+        `step` keeps every step-th bucket (always including the newest)."""
+        if last is not None:
+            start = max(0, len(self) - last)
+            start_hour = max(start_hour or -2**31, self.get(start)[0]) if len(self) else start_hour
+        rows = [{time_key: hour_iso(h), **v} for h, v in self.iter_range(start_hour, end_hour)]
+        if step > 1 and rows:
+            rows = rows[::-1][::step][::-1]
+        return rows
+
+    def flush(self):
+        self.map.flush()
+
+    def close(self):
+        if getattr(self, "map", None) is not None and not self.map.closed:
+            self.map.flush()
+            self.map.close()
+        if getattr(self, "file", None) is not None:
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def lttb(points, threshold):
+    """Largest-triangle-three-buckets downsampling of [(x, y), ...] to about `threshold` points.
+    Keeps the first and last points and, per bucket, the point forming the largest triangle
+    with the previously kept point and the next bucket's average."""
+    n = len(points)
+    if threshold >= n or threshold < 3:
+        return list(points)
+    every = (n - 2) / (threshold - 2)
+    out = [points[0]]
+    a = 0
+    for i in range(threshold - 2):
+        start = int(i * every) + 1
+        end = int((i + 1) * every) + 1
+        nxt_end = min(int((i + 2) * every) + 1, n)
+        nxt = points[end:nxt_end] or [points[-1]]
+        avg_x = sum(p[0] for p in nxt) / len(nxt)
+        avg_y = sum(p[1] for p in nxt) / len(nxt)
+        ax, ay = points[a]
+        best, best_area = start, -1.0
+        for j in range(start, end):
+            area = abs((ax - avg_x) * (points[j][1] - ay) - (ax - points[j][0]) * (avg_y - ay))
+            if area > best_area:
+                best, best_area = j, area
+        out.append(points[best])
+        a = best
+    out.append(points[-1])
+    return out
+
+
+def chart_points(series, column):
+    """[[epoch_ms, value], ...] for one column over the whole history (Highcharts' native format)."""
+    return [[h * 3600000, v[column]] for h, v in series.iter_range()]
+
+
+def main():
+    # python series.py <file.bin> <col,col,...> [--last N] [--step K]  -> chart JSON on stdout
+    import argparse
+    import json
+    parser = argparse.ArgumentParser()
+    parser.add_argument("path")
+    parser.add_argument("columns")
+    parser.add_argument("--last", type=int, default=None)
+    parser.add_argument("--step", type=int, default=1)
+    args = parser.parse_args()
+    with HourlySeries(args.path, args.columns.split(",")) as s:
+        json.dump(s.export(last=args.last, step=args.step), sys.stdout)
+
+
+if __name__ == "__main__":
+    main()
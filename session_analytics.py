@@ -0,0 +1,197 @@
+from array import array
+from datetime import date, datetime, timezone
+
+import numpy as np
+
+# Editing-session analytics for every user at once.
+#
+# All changesets go into one columnar table (user index, created, closed, changes). After one
+# lexsort by (user, created), sessions, per-user medians and active-day streaks are all array
+# operations: no Python loop runs per user or per session.
+#
+# A session is a run of a user's changesets where each one starts within SESSION_GAP of the
+# latest close (or creation) so far.
+
+SESSION_GAP = 3600  # seconds
+LENGTH_BINS = [0, 300, 900, 1800, 3600, 7200, 14400, 28800]  # seconds; the last bucket is open-ended
+LENGTH_LABELS = ["<5m", "5-15m", "15-30m", "30-60m", "1-2h", "2-4h", "4-8h", "8h+"]
+SESSION_COUNT_BINS = [1, 2, 5, 10, 25, 50, 100, 250, 1000]
+DAY = 86400
+EPOCH = datetime(1970, 1, 1)
+
+
+def epoch_seconds(ts):
+    """'YYYY-MM-DDTHH:MM:SS[Z]' (UTC) as int seconds since the epoch, or None if it doesn't parse."""
+    try:
+        return int((datetime.fromisoformat(ts[:19]) - EPOCH).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+class ChangesetTable:
+    """Append-only int64 columns. Timestamps are parsed row by row in add(), so a malformed one only drops
+    its own changeset (counted in `skipped`) and arrays() is a zero-copy view."""
+
+    def __init__(self):
+        self.uids = []
+        self.user = array("i")
+        self.created = array("q")
+        self.closed = array("q")
+        self.changes = array("q")
+        self.skipped = 0
+
+    def add_user(self, uid):
+        self.uids.append(str(uid))
+        return len(self.uids) - 1
+
+    def add(self, user, created, closed, changes):
+        if not created:
+            return
+        start = epoch_seconds(created)
+        if start is None:
+            self.skipped += 1
+            return
+        # Open (or unparseable) close times count as closing when they were created
+        end = epoch_seconds(closed) if closed else None
+        try:
+            changes = int(changes or 0)
+        except (TypeError, ValueError):
+            changes = 0
+        self.user.append(user)
+        self.created.append(start)
+        self.closed.append(start if end is None else max(end, start))
+        self.changes.append(changes)
+
+    def arrays(self):
+        return (np.frombuffer(self.user, dtype=np.int32).astype(np.int64), np.frombuffer(self.created, dtype=np.int64),
+                np.frombuffer(self.closed, dtype=np.int64), np.frombuffer(self.changes, dtype=np.int64))
+
+
+def group_median(groups, values, n_groups):
+    """Median of `values` per group id in [0, n_groups); NaN for empty groups."""
+    out = np.full(n_groups, np.nan)
+    if not len(values):
+        return out
+    order = np.lexsort((values, groups))
+    v = values[order].astype(float)
+    counts = np.bincount(groups, minlength=n_groups)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    has = counts > 0
+    lo = starts[has] + (counts[has] - 1) // 2
+    hi = starts[has] + counts[has] // 2
+    out[has] = (v[lo] + v[hi]) / 2
+    return out
+
+
+def group_max(groups, values, n_groups, fill=0):
+    out = np.full(n_groups, fill, dtype=values.dtype if len(values) else np.int64)
+    np.maximum.at(out, groups, values)
+    return out
+
+
+def sessions(user, created, closed, changes):
+    """Per-session arrays (user, start, end, changesets, changes), sorted by (user, start)."""
+    order = np.lexsort((created, user))
+    user, created, closed, changes = user[order], created[order], closed[order], changes[order]
+    n = len(user)
+    if not n:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, empty, empty, empty
+
+    # Running latest end within each user: offset every user's times so one cumulative max never crosses users
+    shift = np.int64(1) << 36
+    running_end = np.maximum.accumulate(user * shift + closed) - user * shift
+    new = np.ones(n, dtype=bool)
+    new[1:] = (user[1:] != user[:-1]) | (created[1:] - running_end[:-1] > SESSION_GAP)
+    starts = np.flatnonzero(new)
+
+    s_user = user[starts]
+    s_start = created[starts]
+    s_end = np.maximum.reduceat(closed, starts)
+    s_count = np.diff(np.append(starts, n))
+    s_changes = np.add.reduceat(changes, starts)
+    return s_user, s_start, s_end, s_count, s_changes
+
+
+def streaks(user, created, n_users, today):
+    """(active days, longest streak, current streak) per user; current counts only if it reaches today or yesterday."""
+    days = np.unique(user * (np.int64(1) << 32) + created // DAY)
+    d_user = days >> 32
+    d_day = days & ((np.int64(1) << 32) - 1)
+    active = np.bincount(d_user, minlength=n_users)
+    if not len(days):
+        zeros = np.zeros(n_users, dtype=np.int64)
+        return active, zeros, zeros
+
+    new = np.ones(len(days), dtype=bool)
+    new[1:] = (d_user[1:] != d_user[:-1]) | (d_day[1:] - d_day[:-1] != 1)
+    run_id = np.cumsum(new) - 1
+    run_len = np.bincount(run_id)
+    run_user = d_user[new]
+    run_last_day = d_day[np.append(np.flatnonzero(new)[1:] - 1, len(days) - 1)]
+
+    longest = group_max(run_user, run_len, n_users)
+    # Each user's last run is the one with the highest run id
+    last_run = group_max(run_user, np.arange(len(run_len)), n_users, fill=-1)
+    current = np.zeros(n_users, dtype=np.int64)
+    has = last_run >= 0
+    live = has.copy()
+    live[has] = run_last_day[last_run[has]] >= today - 1
+    current[live] = run_len[last_run[live]]
+    return active, longest, current
+
+
+def count_labels():
+    labels = []
+    for lo, hi in zip(SESSION_COUNT_BINS, SESSION_COUNT_BINS[1:] + [None]):
+        labels.append(f"{lo}+" if hi is None else str(lo) if hi == lo + 1 else f"{lo}-{hi - 1}")
+    return labels
+
+
+def compute(table, today=None):
+    """Returns ({uid: stats}, site summary) for every user in the table. Current streaks are measured
+    against `today` (a date; defaults to the current UTC date)."""
+    user, created, closed, changes = table.arrays()
+    n_users = len(table.uids)
+    today = ((today or datetime.now(timezone.utc).date()) - date(1970, 1, 1)).days
+
+    s_user, s_start, s_end, s_count, s_changes = sessions(user, created, closed, changes)
+    s_len = s_end - s_start
+    n_sessions = np.bincount(s_user, minlength=n_users)
+    med_len = group_median(s_user, s_len, n_users)
+    med_changes = group_median(s_user, s_changes, n_users)
+    longest_len = group_max(s_user, s_len, n_users)
+    total_len = np.bincount(s_user, weights=s_len, minlength=n_users)
+    bucket = np.digitize(s_len, LENGTH_BINS[1:])
+    hist = np.zeros((n_users, len(LENGTH_LABELS)), dtype=np.int64)
+    np.add.at(hist, (s_user, bucket), 1)
+    active, longest_streak, current_streak = streaks(user, created, n_users, today)
+
+    per_user = {}
+    for i in np.flatnonzero(n_sessions):
+        per_user[table.uids[i]] = {
+            "sessions": int(n_sessions[i]),
+            "median_session_minutes": round(float(med_len[i]) / 60, 1),
+            "mean_session_minutes": round(float(total_len[i]) / n_sessions[i] / 60, 1),
+            "longest_session_minutes": round(float(longest_len[i]) / 60, 1),
+            "median_changes_per_session": float(med_changes[i]),
+            "length_histogram": dict(zip(LENGTH_LABELS, hist[i].tolist())),
+            "active_days": int(active[i]),
+            "longest_streak": int(longest_streak[i]),
+            "current_streak": int(current_streak[i]),
+        }
+
+    mappers = n_sessions > 0
+    site_hist = np.bincount(bucket, minlength=len(LENGTH_LABELS))
+    per_user_bins = np.histogram(n_sessions[mappers], bins=SESSION_COUNT_BINS + [np.iinfo(np.int64).max])[0]
+    summary = {
+        "users": int(mappers.sum()),
+        "sessions": int(len(s_len)),
+        "session_gap_minutes": SESSION_GAP // 60,
+        "median_session_minutes": round(float(np.median(s_len)) / 60, 1) if len(s_len) else None,
+        "median_changes_per_session": float(np.median(s_changes)) if len(s_changes) else None,
+        "session_length_histogram": dict(zip(LENGTH_LABELS, site_hist.tolist())),
+        "sessions_per_user_histogram": dict(zip(count_labels(), per_user_bins.tolist())),
+        "longest_streak_percentiles": {str(p): float(np.percentile(longest_streak[mappers], p)) for p in (50, 90, 99)} if mappers.any() else {},
+    }
+    return per_user, summary
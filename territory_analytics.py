@@ -0,0 +1,111 @@
+import json
+from datetime import datetime, timezone
+
+import numpy as np
+
+from publish import atomic_write_json
+
+# Growth rankings over the consolidated territory store (see ts.py, territory-store.json).
+# Everything is computed on [territory x run] arrays at once; nothing loops per territory.
+
+METRICS = ["nodes", "ways", "relations", "total"]
+WINDOWS = {"day": 86400, "week": 7 * 86400, "month": 30 * 86400}
+ROLLING_RUNS = 7
+WINDOW_TOLERANCE = 0.25  # how far (as a fraction of the window) the nearest run may be from the window start
+COLUMNS = ["rel", "territory", "value", "d_day", "d_week", "d_month", "g_week", "g_month", "avg7", "rank", "rank_change_week"]
+
+
+def load_matrix(store, metric):
+    """Decodes one metric's delta columns into a forward-filled float array (NaN before a territory's first count)."""
+    rels = list(store["territories"])
+    n = len(store["timestamps"])
+    deltas = np.full((len(rels), n), np.nan)
+    for i, rel in enumerate(rels):
+        col = store["territories"][rel][metric]
+        deltas[i, :len(col)] = np.array(col, dtype=float)
+
+    present = ~np.isnan(deltas)
+    values = np.where(present, np.cumsum(np.nan_to_num(deltas), axis=1), np.nan)
+    last_seen = np.maximum.accumulate(np.where(present, np.arange(n), 0), axis=1)
+    return rels, values[np.arange(len(rels))[:, None], last_seen]
+
+
+def values_at(values, stamps, seconds_ago):
+    """Column of values from the run nearest to `seconds_ago` before the latest one. NaN if no earlier run is
+    within WINDOW_TOLERANCE of that point, so a late-running "day" never spans two runs."""
+    target = stamps[-1] - seconds_ago
+    i = np.searchsorted(stamps, target)
+    candidates = [j for j in (i - 1, i) if 0 <= j < len(stamps) - 1]
+    if not candidates:
+        return np.full(values.shape[0], np.nan)
+    idx = min(candidates, key=lambda j: abs(stamps[j] - target))
+    if abs(stamps[idx] - target) > seconds_ago * WINDOW_TOLERANCE:
+        return np.full(values.shape[0], np.nan)
+    return values[:, idx]
+
+
+def rank_desc(col):
+    """1-based rank, largest first; NaN sorts last."""
+    order = np.argsort(-np.nan_to_num(col, nan=-np.inf), kind="stable")
+    ranks = np.empty(len(col), dtype=int)
+    ranks[order] = np.arange(1, len(col) + 1)
+    return ranks
+
+
+def _clean(x):
+    return None if x is None or (isinstance(x, float) and np.isnan(x)) else x
+
+
+def compute_rankings(store):
+    stamps = np.array([datetime.strptime(t, "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=timezone.utc).timestamp()
+                       for t in store["timestamps"]])
+    names = [store["territories"][rel]["name"] for rel in store["territories"]]
+    out = {}
+    for metric in METRICS:
+        rels, values = load_matrix(store, metric)
+        current = values[:, -1]
+        deltas = {w: current - values_at(values, stamps, secs) for w, secs in WINDOWS.items()}
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            growth = {w: np.where(values_at(values, stamps, WINDOWS[w]) > 0,
+                                  deltas[w] / values_at(values, stamps, WINDOWS[w]), np.nan)
+                      for w in ("week", "month")}
+
+        # Average per-run increase over the last ROLLING_RUNS runs
+        steps = np.diff(values, axis=1)[:, -ROLLING_RUNS:]
+        with np.errstate(invalid="ignore"):
+            avg = np.nanmean(steps, axis=1) if steps.shape[1] else np.full(len(rels), np.nan)
+
+        rank_now = rank_desc(deltas["week"])
+        prev_week = values_at(values, stamps, WINDOWS["week"]) - values_at(values, stamps, 2 * WINDOWS["week"])
+        rank_change = rank_desc(prev_week) - rank_now
+
+        cols = [current, deltas["day"], deltas["week"], deltas["month"],
+                np.round(growth["week"], 5), np.round(growth["month"], 5), np.round(avg, 1)]
+        rows = []
+        for i in np.argsort(rank_now, kind="stable"):
+            nums = [_clean(float(c[i])) for c in cols]
+            nums = [int(v) if v is not None and k < 4 else v for k, v in enumerate(nums)]
+            change = None if np.isnan(prev_week[i]) else int(rank_change[i])
+            rows.append([rels[i], names[i], *nums, int(rank_now[i]), change])
+        out[metric] = rows
+    return out
+
+
+def run(store_file, out_file):
+    try:
+        with open(store_file, encoding="utf-8") as f:
+            store = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"❌ Territory analytics skipped, store unreadable: {e}")
+        return
+    if not store["timestamps"]:
+        return
+
+    result = {
+        "generated": store["timestamps"][-1],
+        "columns": COLUMNS,
+        "rankings": compute_rankings(store),
+    }
+    atomic_write_json(out_file, result, separators=(",", ":"))
+    print(f"✓ Territory rankings written to {out_file}.")
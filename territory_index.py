@@ -0,0 +1,147 @@
+import json
+import os
+
+# Spatial lookup of territory boundaries: an STR-packed R-tree over boundary bboxes,
+# refined with an even-odd point-in-polygon test (holes from inner rings fall out naturally).
+
+NODE_CAPACITY = 16
+
+
+def assemble_rings(ways):
+    """Joins way geometries ([[lat, lon], ...]) end to end into closed rings. Unclosable pieces are dropped."""
+    pending = [list(w) for w in ways if len(w) >= 2]
+    rings = []
+    while pending:
+        ring = pending.pop()
+        while ring[0] != ring[-1]:
+            for i, w in enumerate(pending):
+                if w[0] == ring[-1]:
+                    ring.extend(w[1:])
+                elif w[-1] == ring[-1]:
+                    ring.extend(reversed(w[:-1]))
+                else:
+                    continue
+                pending.pop(i)
+                break
+            else:
+                break  # open ring, the boundary has a gap
+        if ring[0] == ring[-1] and len(ring) >= 4:
+            rings.append(ring)
+    return rings
+
+
+def boundary_from_overpass(data):
+    """Turns an `out geom;` relation response into {rel, name, rings, bbox}."""
+    rel = next(el for el in data["elements"] if el["type"] == "relation")
+    ways = [[[p["lat"], p["lon"]] for p in m["geometry"]]
+            for m in rel.get("members", []) if m["type"] == "way" and m.get("geometry") and m.get("role") in ("outer", "inner", "")]
+    rings = assemble_rings(ways)
+    tags = rel.get("tags", {})
+    return {
+        "rel": str(rel["id"]),
+        "name": tags.get("name:en") or tags.get("name", "unknown"),
+        "rings": rings,
+        "bbox": ring_bbox([p for r in rings for p in r]) if rings else None,
+    }
+
+
+def ring_bbox(points):
+    lats = [p[0] for p in points]
+    lons = [p[1] for p in points]
+    return [min(lats), min(lons), max(lats), max(lons)]
+
+
+def point_in_rings(lat, lon, rings):
+    inside = False
+    for ring in rings:
+        j = len(ring) - 1
+        for i in range(len(ring)):
+            yi, xi = ring[i]
+            yj, xj = ring[j]
+            if (yi > lat) != (yj > lat) and lon < (xj - xi) * (lat - yi) / (yj - yi) + xi:
+                inside = not inside
+            j = i
+    return inside
+
+
+def _union(boxes):
+    return [min(b[0] for b in boxes), min(b[1] for b in boxes), max(b[2] for b in boxes), max(b[3] for b in boxes)]
+
+
+def _str_pack(items):
+    """Sort-Tile-Recursive packing of [(bbox, payload)] into one level of parent nodes."""
+    n_nodes = -(-len(items) // NODE_CAPACITY)
+    n_slices = max(1, int(n_nodes ** 0.5 + 0.999))
+    per_slice = n_slices * NODE_CAPACITY
+    items = sorted(items, key=lambda it: it[0][1] + it[0][3])  # by lon centre
+    parents = []
+    for s in range(0, len(items), per_slice):
+        vertical = sorted(items[s:s + per_slice], key=lambda it: it[0][0] + it[0][2])  # by lat centre
+        for c in range(0, len(vertical), NODE_CAPACITY):
+            children = vertical[c:c + NODE_CAPACITY]
+            parents.append((_union([ch[0] for ch in children]), children))
+    return parents
+
+
+def scrub_name(name):
+    """Territory name made safe for the CSV outputs: no commas, line breaks or repeated whitespace."""
+    name = (name or "").replace('\n', ' ').replace('\r', ' ').replace(',', '').strip()
+    return " ".join(name.split())
+
+
+class TerritoryIndex:
+    def __init__(self, boundaries):
+        self.boundaries = {b["rel"]: b for b in boundaries if b.get("bbox")}
+        level = [(b["bbox"], b["rel"]) for b in self.boundaries.values()]
+        self.depth = 0
+        while len(level) > NODE_CAPACITY:
+            level = _str_pack(level)
+            self.depth += 1
+        self.root = level
+
+    @classmethod
+    def load(cls, geom_dir):
+        boundaries = []
+        if os.path.isdir(geom_dir):
+            for fname in os.listdir(geom_dir):
+                if not fname.endswith(".json"):
+                    continue
+                try:
+                    with open(os.path.join(geom_dir, fname), encoding="utf-8") as f:
+                        boundaries.append(json.load(f))
+                except (OSError, ValueError):
+                    continue
+        return cls(boundaries)
+
+    def candidates(self, lat, lon):
+        stack = [(self.root, self.depth)]
+        while stack:
+            entries, depth = stack.pop()
+            for bbox, child in entries:
+                if bbox[0] <= lat <= bbox[2] and bbox[1] <= lon <= bbox[3]:
+                    if depth == 0:
+                        yield child
+                    else:
+                        stack.append((child, depth - 1))
+
+    def locate(self, lat, lon):
+        """Returns the rel id (str) of the territory containing the point, or None."""
+        if lat is None or lon is None:
+            return None
+        for rel in self.candidates(lat, lon):
+            if point_in_rings(lat, lon, self.boundaries[rel]["rings"]):
+                return rel
+        return None
+
+    def locate_all(self, lat, lon):
+        """Rel ids of every territory containing the point (nested and overlapping ones included)."""
+        if lat is None or lon is None:
+            return []
+        return [rel for rel in self.candidates(lat, lon) if point_in_rings(lat, lon, self.boundaries[rel]["rings"])]
+
+    def name(self, rel):
+        b = self.boundaries.get(rel)
+        return b["name"] if b else None
+
+    def __len__(self):
+        return len(self.boundaries)
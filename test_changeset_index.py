@@ -0,0 +1,61 @@
+import json
+
+import day_archive
+import changeset_index
+
+
+def cs(i, created, uid):
+    return {"id": str(i), "uid": uid, "created_at": created}
+
+
+def build(cache_dir, monkeypatch):
+    monkeypatch.setattr(day_archive, "BLOCK_ENTRIES", 2)
+    day_archive.append_day(cache_dir, "2026-09-30", [cs(1, "2026-09-30T10:00:00Z", 7)])
+    day_archive.append_day(cache_dir, "2026-10-01", [cs(3, "2026-10-01T12:00:00Z", 8), cs(2, "2026-10-01T11:00:00Z", 7)])
+    day_archive.append_day(cache_dir, "2026-10-02", [cs(4, "2026-10-02T01:00:00Z", 8), cs(5, "2026-10-02T02:00:00Z", 8)])
+    day_archive.compact(cache_dir, "2026-10-03")
+    day_archive.append_day(cache_dir, "2026-10-03", [cs(6, "2026-10-03T05:00:00Z", 7)])
+    return changeset_index.refresh(cache_dir)
+
+
+def ids(entries):
+    return [e["id"] for e in entries]
+
+
+def test_catalog_and_postings(tmp_path, monkeypatch):
+    catalog = build(tmp_path, monkeypatch)
+    assert sorted(catalog) == ["2026-09", "2026-10"]
+    assert catalog["2026-10"]["min_id"] == 2 and catalog["2026-10"]["max_id"] == 5
+    assert catalog["2026-10"]["count"] == 4
+    assert changeset_index.load_catalog(tmp_path) == catalog
+    # Blocks of two in (created_at, id) order: [2, 3] [4, 5]
+    postings = json.loads(changeset_index.postings_path(tmp_path, "2026-10").read_text(encoding="utf-8"))
+    assert postings == {"7": [0], "8": [0, 1]}
+
+
+def test_query_matches_a_full_scan(tmp_path, monkeypatch):
+    build(tmp_path, monkeypatch)
+    assert ids(changeset_index.query(tmp_path)) == ["1", "2", "3", "4", "5", "6"]
+    assert ids(changeset_index.query(tmp_path, uid=7)) == ["1", "2", "6"]
+    assert ids(changeset_index.query(tmp_path, uid=8, start="2026-10-02")) == ["4", "5"]
+    assert ids(changeset_index.query(tmp_path, start="2026-10-01T11:30:00Z", end="2026-10-03")) == ["3", "4", "5"]
+    assert ids(changeset_index.query(tmp_path, min_id=3, max_id=4)) == ["3", "4"]
+    assert ids(changeset_index.query(tmp_path, uid=99)) == []
+
+
+def test_refresh_reindexes_changed_and_drops_removed(tmp_path, monkeypatch):
+    build(tmp_path, monkeypatch)
+    day_archive.append_day(tmp_path, "2026-10-02", [cs(9, "2026-10-02T03:00:00Z", 9)])
+    day_archive.compact(tmp_path, "2026-10-03")
+    day_archive.archive_path(tmp_path, "2026-09").unlink()
+
+    catalog = changeset_index.refresh(tmp_path)
+    assert sorted(catalog) == ["2026-10"]
+    assert catalog["2026-10"]["count"] == 5
+    assert not changeset_index.postings_path(tmp_path, "2026-09").exists()
+    assert ids(changeset_index.query(tmp_path, uid=9)) == ["9"]
+
+
+def test_empty_cache(tmp_path):
+    assert changeset_index.refresh(tmp_path) == {}
+    assert list(changeset_index.query(tmp_path)) == []
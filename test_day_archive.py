@@ -0,0 +1,75 @@
+import json
+
+import pytest
+
+import day_archive
+
+
+def cs(i, created, uid=1):
+    return {"id": str(i), "uid": uid, "created_at": created}
+
+
+def test_archive_round_trip_across_blocks(tmp_path, monkeypatch):
+    monkeypatch.setattr(day_archive, "BLOCK_ENTRIES", 3)
+    entries = sorted((cs(i, f"2026-10-{1 + i // 4:02d}T{i % 24:02d}:00:00Z") for i in range(10)), key=day_archive.sort_key)
+    path = tmp_path / "2026-10.archive"
+    day_archive.write_archive(path, entries)
+
+    with day_archive.ArchiveReader(path) as r:
+        assert len(r) == 10
+        assert len(r.blocks) == 4
+        assert list(r.iter()) == entries
+        assert [e["id"] for e in r.iter(start="2026-10-02", end="2026-10-03")] == ["4", "5", "6", "7"]
+        assert [e["id"] for e in r.iter(min_id=8)] == ["8", "9"]
+
+
+def test_empty_archive(tmp_path):
+    path = tmp_path / "2026-10.archive"
+    day_archive.write_archive(path, [])
+    with day_archive.ArchiveReader(path) as r:
+        assert len(r) == 0
+        assert list(r.iter()) == []
+
+
+def test_not_an_archive(tmp_path):
+    path = tmp_path / "bad.archive"
+    path.write_bytes(b"x" * 64)
+    with pytest.raises(ValueError):
+        day_archive.ArchiveReader(path)
+
+
+def test_read_day_skips_torn_last_line(tmp_path):
+    day_archive.append_day(tmp_path, "2026-10-19", [cs(1, "2026-10-19T01:00:00Z")])
+    day_archive.append_day(tmp_path, "2026-10-19", [cs(2, "2026-10-19T02:00:00Z")])
+    with open(day_archive.day_path(tmp_path, "2026-10-19"), "ab") as f:
+        f.write(b'{"id":"3","crea')
+    assert [e["id"] for e in day_archive.read_day(day_archive.day_path(tmp_path, "2026-10-19"))] == ["1", "2"]
+
+
+def test_read_day_legacy_json(tmp_path):
+    bad = tmp_path / "2026-10-18.json"
+    bad.write_text("[{", encoding="utf-8")
+    assert day_archive.read_day(bad) == []
+    with pytest.raises(ValueError):
+        day_archive.read_day(bad, strict=True)
+
+
+def test_compact_sorts_out_of_order_days_and_dedupes(tmp_path):
+    # Appended out of order, and one changeset seen twice (re-fetched after a failed write)
+    day_archive.append_day(tmp_path, "2026-10-02", [cs(5, "2026-10-02T09:00:00Z"), cs(4, "2026-10-02T08:00:00Z")])
+    day_archive.append_day(tmp_path, "2026-10-01", [cs(2, "2026-10-01T10:00:00Z"), cs(1, "2026-10-01T10:00:00Z")])
+    day_archive.append_day(tmp_path, "2026-10-02", [cs(4, "2026-10-02T08:00:00Z")])
+    (tmp_path / "2026-09-30.json").write_text(json.dumps([cs(0, "2026-09-30T23:00:00Z")]), encoding="utf-8")
+    day_archive.append_day(tmp_path, "2026-10-03", [cs(6, "2026-10-03T00:00:00Z")])
+
+    assert day_archive.compact(tmp_path, "2026-10-03") == ["2026-09", "2026-10"]
+    with day_archive.ArchiveReader(day_archive.archive_path(tmp_path, "2026-10")) as r:
+        assert [e["id"] for e in r.iter()] == ["1", "2", "4", "5"]
+    with day_archive.ArchiveReader(day_archive.archive_path(tmp_path, "2026-09")) as r:
+        assert [e["id"] for e in r.iter()] == ["0"]
+    # Today's file stays; compacting again merges into the existing archive
+    assert sorted(p.name for p in tmp_path.glob("2026-*")) == ["2026-10-03.jsonl"]
+    day_archive.append_day(tmp_path, "2026-10-02", [cs(3, "2026-10-02T07:00:00Z")])
+    day_archive.compact(tmp_path, "2026-10-03")
+    with day_archive.ArchiveReader(day_archive.archive_path(tmp_path, "2026-10")) as r:
+        assert [e["id"] for e in r.iter()] == ["1", "2", "3", "4", "5"]
@@ -0,0 +1,68 @@
+import pytest
+
+import series
+from series import HourlySeries, lttb
+
+
+def test_put_reopen_round_trip(tmp_path):
+    path = tmp_path / "hourly.bin"
+    with HourlySeries(path, ["changeset_id", "change"]) as s:
+        assert len(s) == 0
+        assert s.last() == (None, None)
+        s.put(100, changeset_id=10, change=1)
+        s.put(102, changeset_id=12, change=2)
+        s.put(102, change=5)  # current bucket is overwritten in place, other columns kept
+    with HourlySeries(path, ["changeset_id", "change"]) as s:
+        assert len(s) == 2
+        assert s.last() == (102, {"changeset_id": 12, "change": 5})
+        assert s.find(100) == 0 and s.find(101) is None
+        assert list(s.iter_range(101)) == [(102, {"changeset_id": 12, "change": 5})]
+        assert s.export(last=1) == [{"timestamp": series.hour_iso(102), "changeset_id": 12, "change": 5}]
+
+
+def test_out_of_order_puts(tmp_path):
+    with HourlySeries(tmp_path / "s.bin", ["n"]) as s:
+        s.put(10, n=1)
+        s.put(20, n=2)
+        s.put(10, n=7)  # an existing earlier bucket can still be overwritten
+        assert s.get(0) == (10, {"n": 7})
+        with pytest.raises(ValueError):
+            s.put(15, n=3)  # but nothing is inserted before the last bucket
+        assert [h for h, _ in s.iter_range()] == [10, 20]
+
+
+def test_grows_past_initial_capacity(tmp_path, monkeypatch):
+    monkeypatch.setattr(series, "GROW_MIN", 4)
+    path = tmp_path / "s.bin"
+    with HourlySeries(path, ["n"]) as s:
+        for h in range(50):
+            s.put(h, n=h * h)
+    with HourlySeries(path, ["n"]) as s:
+        assert len(s) == 50
+        assert s.get(-1) == (49, {"n": 2401})
+        assert [v["n"] for _, v in s.iter_range(10, 13)] == [100, 121, 144]
+
+
+def test_column_mismatch_is_rejected(tmp_path):
+    path = tmp_path / "s.bin"
+    HourlySeries(path, ["a"]).close()
+    with pytest.raises(ValueError):
+        HourlySeries(path, ["b"])
+
+
+def test_lttb_keeps_ends_and_peaks():
+    points = [(x, 0) for x in range(100)]
+    points[37] = (37, 50)
+    points[71] = (71, -40)
+    out = lttb(points, 10)
+    assert len(out) == 10
+    assert out[0] == points[0] and out[-1] == points[-1]
+    assert (37, 50) in out and (71, -40) in out
+    assert [p[0] for p in out] == sorted(p[0] for p in out)
+
+
+def test_lttb_small_inputs_pass_through():
+    assert lttb([], 10) == []
+    assert lttb([(0, 1), (1, 2)], 10) == [(0, 1), (1, 2)]
+    points = [(x, x) for x in range(20)]
+    assert lttb(points, 2) == points  # thresholds below 3 can't keep both ends and a middle point
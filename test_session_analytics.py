@@ -0,0 +1,76 @@
+from datetime import date
+
+import numpy as np
+
+import session_analytics as sa
+
+
+def table(rows):
+    """rows: [(uid, created, closed, changes)]"""
+    t = sa.ChangesetTable()
+    users = {}
+    for uid, created, closed, changes in rows:
+        if uid not in users:
+            users[uid] = t.add_user(uid)
+        t.add(users[uid], created, closed, changes)
+    return t
+
+
+def test_sessions_split_on_gap_and_span_overlaps():
+    t = table([
+        (1, "2026-10-10T10:00:00Z", "2026-10-10T12:00:00Z", 3),  # long changeset...
+        (1, "2026-10-10T10:30:00Z", "2026-10-10T10:40:00Z", 2),  # ...with a short one inside it
+        (1, "2026-10-10T12:50:00Z", "2026-10-10T13:00:00Z", 1),  # within the gap of 12:00, same session
+        (1, "2026-10-10T15:00:00Z", None, 4),                    # open: a zero-length session
+    ])
+    s_user, s_start, s_end, s_count, s_changes = sa.sessions(*t.arrays())
+    assert s_count.tolist() == [3, 1]
+    assert s_changes.tolist() == [6, 4]
+    assert (s_end - s_start).tolist() == [3 * 3600, 0]
+
+
+def test_rows_in_any_order_give_the_same_stats():
+    rows = [(u, f"2026-10-{d:02d}T{h:02d}:00:00Z", f"2026-10-{d:02d}T{h:02d}:20:00Z", d + h)
+            for u in (1, 2) for d in (1, 2, 3, 9) for h in (8, 9, 18)]
+    today = date(2026, 10, 10)
+    assert sa.compute(table(rows), today) == sa.compute(table(rows[::-1]), today)
+
+
+def test_streaks():
+    days = [1, 2, 3, 6, 7, 9, 10]
+    t = table([(1, f"2026-10-{d:02d}T12:00:00Z", None, 1) for d in days] + [(2, "2026-10-01T00:00:00Z", None, 1)])
+    per_user, summary = sa.compute(t, date(2026, 10, 11))
+    assert per_user["1"]["active_days"] == 7
+    assert per_user["1"]["longest_streak"] == 3
+    assert per_user["1"]["current_streak"] == 2  # last active yesterday
+    assert per_user["2"]["current_streak"] == 0
+    assert summary["users"] == 2
+
+
+def test_medians():
+    groups = np.array([0, 0, 0, 2, 2], dtype=np.int64)
+    values = np.array([5, 1, 3, 10, 20], dtype=np.int64)
+    out = sa.group_median(groups, values, 3)
+    assert out[0] == 3 and np.isnan(out[1]) and out[2] == 15
+
+
+def test_malformed_rows_are_skipped():
+    t = table([
+        (1, "2026-10-10T10:00:00Z", "2026-10-10T10:30:00Z", 1),
+        (1, "not a date", "2026-10-10T10:30:00Z", 1),
+        (1, "2026-10-10T11:00:00Z", "garbage", "x"),
+        (2, None, None, 1),
+    ])
+    assert t.skipped == 1
+    user, created, closed, changes = t.arrays()
+    assert len(created) == 2
+    assert closed[1] == created[1]  # unreadable close time: treated as open
+    assert changes.tolist() == [1, 0]
+
+
+def test_empty_table():
+    t = sa.ChangesetTable()
+    t.add_user(1)
+    per_user, summary = sa.compute(t, date(2026, 10, 10))
+    assert per_user == {}
+    assert summary["sessions"] == 0 and summary["median_session_minutes"] is None
@@ -0,0 +1,43 @@
+import ts
+
+
+def row(rel, name, nodes, ways=0):
+    return {"rel": rel, "territory": name, "nodes": nodes, "ways": ways, "relations": 0, "areas": 0, "total": nodes + ways}
+
+
+def test_store_round_trip_with_gaps():
+    store = ts.new_store()
+    ts.store_append(store, "2026-10-01T00:00:00Z", [row("1", "A", 100), row("2", "B", 5)])
+    ts.store_append(store, "2026-10-02T00:00:00Z", [row("1", "A", 90)])  # B not counted this run
+    ts.store_append(store, "2026-10-03T00:00:00Z", [row("1", "A2", 130), row("2", "B", 8), row("3", "C", 1)])
+
+    assert store["territories"]["1"]["nodes"] == [100, -10, 40]  # first value, then deltas
+    assert ts.decode_column(store["territories"]["1"]["nodes"]) == [100, 90, 130]
+    assert ts.decode_column(store["territories"]["2"]["nodes"]) == [5, None, 8]
+    assert ts.decode_column(store["territories"]["3"]["nodes"]) == [None, None, 1]
+    assert store["territories"]["1"]["name"] == "A2"
+
+
+def test_store_ignores_stale_and_repeated_runs():
+    store = ts.new_store()
+    ts.store_append(store, "2026-10-02T00:00:00Z", [row("1", "A", 10)])
+    ts.store_append(store, "2026-10-02T00:00:00Z", [row("1", "A", 99)])
+    ts.store_append(store, "2026-10-01T00:00:00Z", [row("1", "A", 99)])
+    assert store["timestamps"] == ["2026-10-02T00:00:00Z"]
+    assert ts.decode_column(store["territories"]["1"]["nodes"]) == [10]
+
+
+def test_blank_cells_are_missing():
+    store = ts.new_store()
+    ts.store_append(store, "2026-10-01T00:00:00Z", [row("1", "A", 10)])
+    ts.store_append(store, "2026-10-02T00:00:00Z", [{"rel": "1", "territory": "A", "nodes": "", "ways": "3"}])
+    ts.store_append(store, "2026-10-03T00:00:00Z", [row("1", "A", 15)])
+    assert ts.decode_column(store["territories"]["1"]["nodes"]) == [10, None, 15]
+    assert ts.decode_column(store["territories"]["1"]["ways"]) == [0, 3, 0]
+
+
+def test_empty_store():
+    assert ts.decode_column([]) == []
+    store = ts.new_store()
+    ts.store_append(store, "2026-10-01T00:00:00Z", [])
+    assert store == {"timestamps": ["2026-10-01T00:00:00Z"], "territories": {}}
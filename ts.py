@@ -1,24 +1,60 @@
+import io
 import os
+import re
 import csv
 import json
 import time
+import argparse
+import threading
+import glob
 import requests
-from datetime import datetime
+import territory_index
+import day_archive
+import changeset_content
+import profiling
+from publish import Snapshot, atomic_write_text, atomic_write_json
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
 
 # ================= CONFIG =================
 
 TERRITORY_URL = "https://wiki.opengeofiction.net/index.php/OpenGeofiction:Territory_administration?action=raw"
 OVERPASS_URL = "https://overpass.opengeofiction.net/api/interpreter"
+OVERPASS_STATUS_URL = "https://overpass.opengeofiction.net/api/status"
+
+# Concurrency: number of Overpass queries in flight and per-territory retry budget
+DEFAULT_WORKERS = 2
+MAX_RETRIES = 4
+RETRY_BACKOFF = 15  # seconds, doubled on each retry
+
+# Batching: many relations per Overpass query, sized to keep each query near the target time
+BATCH_START = 8
+BATCH_MAX = 64
+BATCH_TARGET_SECONDS = 300
 
 DATA_DIR = "/var/www/ogfstats/tdata"
 ADMIN_DIR = os.path.join(DATA_DIR, "territory-admin")
 STATS_DIR = os.path.join(DATA_DIR, "territory")
 LATEST_FILE = os.path.join(DATA_DIR, "territory-latest.csv")
+JOURNAL_FILE = os.path.join(DATA_DIR, "territory-run.jsonl")
+JOURNAL_MAX_AGE = 12 * 3600  # older unfinished runs are closed out instead of resumed
+BBOX_FILE = os.path.join(DATA_DIR, "territory-bbox.json")
+STORE_FILE = os.path.join(DATA_DIR, "territory-store.json")
+GEOM_DIR = os.path.join(DATA_DIR, "territory-geom")
+RANKINGS_FILE = os.path.join(DATA_DIR, "territory-rankings.json")
+GEOM_MAX_AGE = 30 * 86400  # boundaries rarely move, refresh monthly
+BUNDLE_METRICS = ["nodes", "ways", "relations"]
+METRICS = ["nodes", "ways", "relations", "areas", "total"]
+
+# Changeset day files written by ogfstats.py, used to skip territories nobody edited
+CACHE_DIR = "/var/www/ogfstats/user_cache"
+FULL_REFRESH_DAYS = 7  # re-count every territory at least this often, edited or not
 
 HTML_OUTPUT_PATH = "/var/www/ogfstats/territory.html"
 
 os.makedirs(ADMIN_DIR, exist_ok=True)
 os.makedirs(STATS_DIR, exist_ok=True)
+os.makedirs(GEOM_DIR, exist_ok=True)
 
 ADMIN_JSON = os.path.join(ADMIN_DIR, "territory_admin.json")
 WEEK_IN_SECONDS = 604800  # 7 days * 24h * 60m * 60s
@@ -119,6 +155,36 @@ HTML_TEMPLATE = """<!DOCTYPE html>
 <script>
 let lineCharts = [];
 let loadedData = {};
+let bundlesPromise = null;
+
+// Combined per-metric history bundles: one request per metric instead of one CSV per territory
+function loadBundles() {
+    if (!bundlesPromise) {
+        const metrics = ["nodes", "ways", "relations"];
+        bundlesPromise = Promise.all(metrics.map(m =>
+            fetch(`./tdata/territory-bundle-${m}.json`, { cache: "no-store" }).then(r => {
+                if (!r.ok) throw new Error("Bundle not found");
+                return r.json();
+            })
+        )).then(parts => {
+            const out = {};
+            metrics.forEach((m, i) => out[m] = parts[i]);
+            return out;
+        }).catch(() => null);
+    }
+    return bundlesPromise;
+}
+
+function decodeSeries(bundle, rel) {
+    const deltas = bundle.series[rel];
+    if (!deltas) return null;
+    let value = 0;
+    const out = [];
+    deltas.forEach((d, i) => {
+        if (d !== null) { value += d; out.push([bundle.timestamps[i], value]); }
+    });
+    return out;
+}
 
 // Handle Highcharts dark mode themes automatically
 Highcharts.setOptions({
@@ -175,6 +241,14 @@ async function buildDashboard() {
 
 async function toggleTerritory(name, rel, state) {
     if (state) {
+        const bundles = !loadedData[name] ? await loadBundles() : null;
+        if (!loadedData[name] && bundles && bundles.nodes.series[rel]) {
+            loadedData[name] = {
+                nodes: decodeSeries(bundles.nodes, rel),
+                ways: decodeSeries(bundles.ways, rel),
+                relations: decodeSeries(bundles.relations, rel)
+            };
+        }
         if (!loadedData[name]) {
             const safeName = name.replace(/,/g, "")
                                  .replace(/\\//g, "-")
@@ -281,8 +355,7 @@ def fetch_admin_json():
         try:
             r = requests.get(TERRITORY_URL, timeout=60)
             r.raise_for_status()
-            with open(ADMIN_JSON, "w", encoding="utf-8") as f:
-                f.write(r.text)
+            atomic_write_text(ADMIN_JSON, r.text)
             print("✓ Admin JSON updated successfully.")
         except Exception as e:
             print(f"❌ Failed to update Admin JSON: {e}")
@@ -295,44 +368,380 @@ def load_owned_territories():
     return [t for t in data if t.get("status") == "owned" and t.get("rel")]
 
 def run_overpass(rel_id):
-    query = f'[out:json][timeout:900];relation({rel_id})->.rel;.rel map_to_area->.a;(node(area.a);way(area.a);relation(area.a););out count;.rel convert relation ::id = id(), name = t["name:en"] ? t["name:en"] : t["name"];out;'
+    query = f'[out:json][timeout:900];relation({rel_id})->.rel;.rel map_to_area->.a;(node(area.a);way(area.a);relation(area.a););out count;.rel convert relation ::id = id(), name = t["name:en"] ? t["name:en"] : t["name"];out;.rel out ids bb;'
     r = requests.post(OVERPASS_URL, data=query, timeout=300)
     r.raise_for_status()
     return r.json()
 
+def run_overpass_batch(rel_ids):
+    """One query for several relations. Each block starts with a `label` element carrying its rel id."""
+    parts = ['[out:json][timeout:900];']
+    for rel_id in rel_ids:
+        parts.append(f'relation({rel_id})->.rel;make label rel={rel_id};out;.rel map_to_area->.a;(node(area.a);way(area.a);relation(area.a););out count;.rel convert relation ::id = id(), name = t["name:en"] ? t["name:en"] : t["name"];out;.rel out ids bb;')
+    r = requests.post(OVERPASS_URL, data="".join(parts), timeout=960)
+    r.raise_for_status()
+    return r.json()
+
+def split_batch_response(data):
+    """Splits a batched response into {rel_id: single-territory response} keyed by the label elements."""
+    remark = data.get("remark") or ""
+    if "error" in remark:
+        raise RuntimeError(remark.strip())
+    blocks = {}
+    current = None
+    for el in data["elements"]:
+        if el["type"] == "label":
+            current = blocks.setdefault(str(el["tags"]["rel"]), [])
+        elif current is not None:
+            current.append(el)
+    return {rel: {"elements": els} for rel, els in blocks.items()}
+
 def parse_overpass(data):
     counts = next(el["tags"] for el in data["elements"] if el["type"] == "count")
     name = next((el.get("tags", {}).get("name", "unknown") for el in data["elements"] if el["type"] == "relation"), "unknown")
 
     # SCRUBBING: Remove commas and hidden line breaks for CSV safety
-    name = name.replace('\n', ' ').replace('\r', ' ').replace(',', '').strip()
-    name = " ".join(name.split())
+    name = territory_index.scrub_name(name)
 
     return name, {k: int(counts[k]) for k in ["nodes", "ways", "relations", "areas", "total"]}
 
-# ================= MAIN =================
-
-def main():
-    fetch_admin_json()
-    territories = load_owned_territories()
-
-    with open(HTML_OUTPUT_PATH, "w", encoding="utf-8") as f:
-        f.write(HTML_TEMPLATE)
-    print(f"✓ HTML file created at {HTML_OUTPUT_PATH}.")
-
-    timestamp = datetime.utcnow().isoformat(timespec="seconds") + "Z"
-    fieldnames = ["territory", "rel", "nodes", "ways", "relations", "areas", "total", "timestamp"]
-
-    print(f"Processing {len(territories)} territories...")
-
-    for i, t in enumerate(territories):
-        rel_id = t["rel"]
+def parse_bounds(data):
+    b = next((el["bounds"] for el in data["elements"] if "bounds" in el), None)
+    return [b["minlat"], b["minlon"], b["maxlat"], b["maxlon"]] if b else None
+
+# ================= CHANGE DETECTION =================
+
+_bbox_lock = threading.Lock()
+
+def load_bbox_cache():
+    try:
+        with open(BBOX_FILE, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_bbox_cache(cache):
+    atomic_write_json(BBOX_FILE, cache)
+
+def load_changeset_bboxes(since):
+    """Returns [(min_lat, min_lon, max_lat, max_lon)] for changesets active at or after `since` (ISO string).
+    Reads the monthly archives and the uncompacted day files (see day_archive.py). Raises if any of them
+    can't be read: a missing bbox would wrongly let a territory be carried forward as unchanged."""
+    # Archives and day files are keyed by created_at, so look back far enough to include changesets
+    # opened earlier and closed after `since`
+    start = (datetime.strptime(since[:19], "%Y-%m-%dT%H:%M:%S") - changeset_content.OPEN_MAX_AGE).strftime("%Y-%m-%dT%H:%M:%SZ")
+    boxes = []
+
+    def take(e):
+        if (e.get("closed_at") or e.get("created_at") or "") < since:
+            return
+        if None in (e.get("min_lat"), e.get("min_lon"), e.get("max_lat"), e.get("max_lon")):
+            return
+        boxes.append((e["min_lat"], e["min_lon"], e["max_lat"], e["max_lon"]))
+
+    for path in sorted(glob.glob(os.path.join(CACHE_DIR, "archive", "*.archive"))):
+        if os.path.basename(path)[:7] < start[:7]:
+            continue
+        with day_archive.ArchiveReader(path) as r:
+            for e in r.iter(start=start):
+                take(e)
+    for path in sorted(glob.glob(os.path.join(CACHE_DIR, "????-??-??.json*"))):
+        if os.path.basename(path)[:10] < start[:10]:
+            continue
+        for e in day_archive.read_day(path, strict=True):
+            if (e.get("created_at") or "") >= start:
+                take(e)
+    return boxes
+
+def bbox_intersects(a, b):
+    return a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3]
+
+def split_touched(territories, bbox_cache, previous):
+    """Splits territories into (to_query, unchanged) using cached bboxes and the ingested changesets."""
+    cutoff = (datetime.utcnow() - timedelta(days=FULL_REFRESH_DAYS)).isoformat(timespec="seconds") + "Z"
+    candidates = []
+    to_query = []
+    for t in territories:
+        cached = bbox_cache.get(str(t["rel"]))
+        if not cached or not cached.get("bbox") or str(t["rel"]) not in previous or cached["counted"] < cutoff:
+            to_query.append(t)
+        else:
+            candidates.append((t, cached))
+    if not candidates:
+        return to_query, []
+
+    try:
+        boxes = load_changeset_bboxes(min(c["counted"] for _, c in candidates))
+    except Exception as e:
+        # Without the edits we can't tell what's unchanged, so count everything
+        print(f"Changeset cache unreadable ({e}); re-counting every territory.")
+        return to_query + [t for t, _ in candidates], []
+    unchanged = []
+    for t, cached in candidates:
+        if any(bbox_intersects(cached["bbox"], box) for box in boxes):
+            to_query.append(t)
+        else:
+            unchanged.append(t)
+    return to_query, unchanged
+
+# ================= CONCURRENT COLLECTOR =================
+
+_slot_lock = threading.Lock()
+_bbox_updates = {}  # rel -> bounds seen in this run
+
+def overpass_slot_wait():
+    """Asks /api/status how long until a query slot frees up. Returns seconds to wait (0 if a slot is free)."""
+    try:
+        r = requests.get(OVERPASS_STATUS_URL, timeout=30)
+        r.raise_for_status()
+        text = r.text
+    except Exception:
+        return 0  # status endpoint unavailable, let the query itself tell us
+
+    if re.search(r"(\d+) slots? available now", text):
+        return 0
+    waits = [int(w) for w in re.findall(r"in (\d+) seconds", text)]
+    return min(waits) if waits else 0
+
+def wait_for_slot():
+    """Blocks until /api/status reports a free slot. Returns the seconds slept (0 if none was needed)."""
+    # Serialised so several workers don't all poll /status and stampede the same free slot
+    slept = 0
+    with _slot_lock:
+        while True:
+            wait = overpass_slot_wait()
+            if wait <= 0:
+                return slept
+            time.sleep(wait + 1)
+            slept += wait + 1
+
+def retry_after(response):
+    try:
+        return max(0, int(response.headers.get("Retry-After")))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+def collect_territory(rel_id):
+    """Runs one territory query with its own retries. Returns (name, stats) or raises the last error."""
+    last_error = None
+    for attempt in range(MAX_RETRIES + 1):
+        wait_for_slot()
         try:
             data = run_overpass(rel_id)
-            name, stats = parse_overpass(data)
+            result = parse_overpass(data)
+            with _bbox_lock:
+                _bbox_updates[str(rel_id)] = parse_bounds(data)
+            return result
+        except requests.HTTPError as e:
+            last_error = e
+            status = e.response.status_code if e.response is not None else None
+            if status == 429:
+                # Rate limited: back off unless /status already made us wait for a slot. /status can
+                # fail or claim a free slot while we're still being refused, so that alone isn't enough
+                if not wait_for_slot():
+                    delay = retry_after(e.response)
+                    time.sleep(delay if delay is not None else RETRY_BACKOFF * (2 ** attempt))
+                continue
+            if status not in (502, 503, 504):
+                raise
+        except (requests.ConnectionError, requests.Timeout) as e:
+            last_error = e
+        time.sleep(RETRY_BACKOFF * (2 ** attempt))
+    raise last_error
+
+def collect_all(territories, workers=DEFAULT_WORKERS, on_result=None):
+    """Queries all territories with a bounded pool. Returns {rel_id: (name, stats) or Exception}.
+    on_result(rel_id, name, stats) is called from the worker thread as each territory succeeds."""
+    results = {}
+    done = [0]
+    done_lock = threading.Lock()
+
+    def task(rel_id):
+        try:
+            result = collect_territory(rel_id)
+            if on_result:
+                on_result(rel_id, *result)
+        except Exception as e:
+            result = e
+        with done_lock:
+            done[0] += 1
+            label = result[0] if isinstance(result, tuple) else f"rel {rel_id} failed ({result})"
+            print(f"[{done[0]}/{len(territories)}] Collected: {label}")
+        return rel_id, result
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        for rel_id, result in pool.map(task, [t["rel"] for t in territories]):
+            results[rel_id] = result
+    return results
+
+def collect_batched(territories, workers=DEFAULT_WORKERS, on_result=None):
+    """Like collect_all, but packs relations into batched queries whose size adapts to query time."""
+    pending = [t["rel"] for t in territories]
+    attempts = {}
+    results = {}
+    state = {"size": BATCH_START}
+    lock = threading.Lock()
+
+    def take():
+        with lock:
+            batch = pending[:state["size"]]
+            del pending[:state["size"]]
+            return batch
+
+    def give_back(rel_ids, error):
+        # Shrink the batch size and requeue; relations that keep failing alone are given up on
+        with lock:
+            state["size"] = max(1, state["size"] // 2)
+            for rel_id in rel_ids:
+                attempts[rel_id] = attempts.get(rel_id, 0) + 1
+                if len(rel_ids) == 1 and attempts[rel_id] > MAX_RETRIES:
+                    results[rel_id] = error
+                    print(f"  ❌ rel {rel_id} failed after {MAX_RETRIES} retries: {error}")
+                else:
+                    pending.insert(0, rel_id)
+
+    def worker():
+        while True:
+            batch = take()
+            if not batch:
+                return
+            wait_for_slot()
+            started = time.time()
+            try:
+                blocks = split_batch_response(run_overpass_batch(batch))
+            except Exception as e:
+                give_back(batch, e)
+                time.sleep(RETRY_BACKOFF)
+                continue
+            elapsed = time.time() - started
+
+            missing = []
+            for rel_id in batch:
+                block = blocks.get(str(rel_id))
+                try:
+                    name, stats = parse_overpass(block)
+                except Exception:
+                    missing.append(rel_id)
+                    continue
+                with _bbox_lock:
+                    _bbox_updates[str(rel_id)] = parse_bounds(block)
+                if on_result:
+                    on_result(rel_id, name, stats)
+                with lock:
+                    results[rel_id] = (name, stats)
+            if missing:
+                give_back(missing, RuntimeError("missing from batch response"))
+
+            with lock:
+                if elapsed < BATCH_TARGET_SECONDS / 2:
+                    state["size"] = min(BATCH_MAX, state["size"] * 2)
+                elif elapsed > BATCH_TARGET_SECONDS:
+                    state["size"] = max(1, state["size"] // 2)
+                print(f"  Batch of {len(batch)} in {elapsed:.0f}s ({len(results)}/{len(territories)} done, next batch {state['size']})")
+
+    threads = [threading.Thread(target=worker) for _ in range(max(1, workers))]
+    for th in threads:
+        th.start()
+    for th in threads:
+        th.join()
+    return results
+
+# ================= BOUNDARY GEOMETRY =================
+
+def fetch_boundary(rel_id):
+    query = f'[out:json][timeout:300];relation({rel_id});out geom;'
+    r = requests.post(OVERPASS_URL, data=query, timeout=360)
+    r.raise_for_status()
+    return territory_index.boundary_from_overpass(r.json())
+
+def fetch_boundaries(territories):
+    """Caches each territory's boundary rings in GEOM_DIR (used by ogfstats.py for changeset attribution)."""
+    fetched = 0
+    for t in territories:
+        path = os.path.join(GEOM_DIR, f"{t['rel']}.json")
+        if os.path.exists(path) and time.time() - os.path.getmtime(path) < GEOM_MAX_AGE:
+            continue
+        wait_for_slot()
+        try:
+            boundary = fetch_boundary(t["rel"])
         except Exception as e:
-            print(f"  ❌ Failed rel {rel_id}: {e}")
+            print(f"  ❌ Boundary for rel {t['rel']} failed: {e}")
             continue
+        atomic_write_json(path, boundary, separators=(",", ":"))
+        fetched += 1
+    if fetched:
+        print(f"✓ Cached {fetched} territory boundaries.")
+
+# ================= CHECKPOINT JOURNAL =================
+
+FIELDNAMES = ["territory", "rel", "nodes", "ways", "relations", "areas", "total", "timestamp"]
+_journal_lock = threading.Lock()
+
+def load_journal():
+    """Returns (timestamp, {rel_id: row}) for an unfinished run, or (None, {}) if there is none."""
+    if not os.path.exists(JOURNAL_FILE):
+        return None, {}
+    # Drop a half-written last line so later appends start on a fresh line
+    with open(JOURNAL_FILE, "rb+") as f:
+        content = f.read()
+        if content and not content.endswith(b"\n"):
+            f.truncate(content.rfind(b"\n") + 1)
+
+    timestamp, rows = None, {}
+    with open(JOURNAL_FILE, encoding="utf-8") as f:
+        for line in f:
+            try:
+                rec = json.loads(line)
+            except ValueError:
+                continue
+            if "run" in rec:
+                timestamp = rec["run"]
+            elif timestamp and "rel" in rec:
+                rows[rec["rel"]] = rec
+    return timestamp, rows
+
+def start_journal(timestamp):
+    with open(JOURNAL_FILE, "w", encoding="utf-8") as f:
+        f.write(json.dumps({"run": timestamp}) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+def journal_append(row):
+    with _journal_lock:
+        with open(JOURNAL_FILE, "a", encoding="utf-8") as f:
+            f.write(json.dumps(row) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+def history_has(hist_path, timestamp):
+    """True if the history CSV already ends with a row for this run (a crash after history writes)."""
+    try:
+        with open(hist_path, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            f.seek(max(0, f.tell() - 512))
+            tail = f.read().decode("utf-8", errors="ignore").strip().splitlines()
+    except OSError:
+        return False
+    return bool(tail) and tail[-1].startswith(timestamp + ",")
+
+def load_latest_rows():
+    """Returns {rel: row} from the current territory-latest.csv."""
+    try:
+        with open(LATEST_FILE, newline="", encoding="utf-8") as f:
+            return {row["rel"]: row for row in csv.DictReader(f)}
+    except OSError:
+        return {}
+
+def finalize_run(territories, timestamp, rows):
+    """Appends history rows and atomically replaces the latest snapshot from the journal, then clears it."""
+    order = [t["rel"] for t in territories]
+    order += [rel for rel in rows if rel not in set(order)]
+    latest_rows = []
+    for rel_id in order:
+        row = rows.get(rel_id)
+        if not row:
+            continue
+        name = row["territory"]
 
         # FILENAME SAFETY: remove commas, turn slashes to dashes
         safe_name = name.replace(",", "").replace("/", "-").replace("\\", "-").replace(" ", "_")
@@ -340,21 +749,229 @@ def main():
         # 1. Append to History
         hist_path = os.path.join(STATS_DIR, f"{safe_name}_{rel_id}.csv")
         write_h = not os.path.exists(hist_path)
-        with open(hist_path, "a", newline="", encoding="utf-8") as f:
-            writer = csv.writer(f, quoting=csv.QUOTE_MINIMAL)
-            if write_h:
-                writer.writerow(["timestamp", "nodes", "ways", "relations", "areas", "total"])
-            writer.writerow([timestamp, stats["nodes"], stats["ways"], stats["relations"], stats["areas"], stats["total"]])
-
-        # 2. Update Latest Snapshot
-        mode = 'w' if i == 0 else 'a'
-        with open(LATEST_FILE, mode, newline="", encoding="utf-8") as f:
-            writer = csv.DictWriter(f, fieldnames=fieldnames, quoting=csv.QUOTE_MINIMAL)
-            if i == 0: writer.writeheader()
-            writer.writerow({"territory": name, "rel": rel_id, **stats, "timestamp": timestamp})
-
-        print(f"[{i+1}/{len(territories)}] Processed: {name}")
-        time.sleep(2)
+        if not history_has(hist_path, timestamp):
+            with open(hist_path, "a", newline="", encoding="utf-8") as f:
+                writer = csv.writer(f, quoting=csv.QUOTE_MINIMAL)
+                if write_h:
+                    writer.writerow(["timestamp", "nodes", "ways", "relations", "areas", "total"])
+                writer.writerow([timestamp, row["nodes"], row["ways"], row["relations"], row["areas"], row["total"]])
+
+        latest_rows.append({k: row[k] for k in FIELDNAMES})
+
+    # 2. Update Latest Snapshot, published together with the chart bundles
+    if latest_rows:
+        buf = io.StringIO(newline="")
+        writer = csv.DictWriter(buf, fieldnames=FIELDNAMES, quoting=csv.QUOTE_MINIMAL)
+        writer.writeheader()
+        writer.writerows(latest_rows)
+        snap = Snapshot(DATA_DIR)
+        snap.write_text(os.path.basename(LATEST_FILE), buf.getvalue())
+        update_store(timestamp, latest_rows, snap)
+        snap.commit()
+
+    os.remove(JOURNAL_FILE)
+    print(f"✓ {len(latest_rows)}/{len(territories)} territories written for {timestamp}.")
+
+# ================= CONSOLIDATED STORE =================
+# territory-store.json keeps every territory's history as columns aligned to one
+# shared timestamp list. Each column holds the first value, then deltas from the
+# previous present value; null marks a run where the territory wasn't counted.
+
+def new_store():
+    return {"timestamps": [], "territories": {}}
+
+def load_store():
+    try:
+        with open(STORE_FILE, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def save_store(store):
+    atomic_write_json(STORE_FILE, store, separators=(",", ":"))
+
+def decode_column(column):
+    out, value = [], None
+    for d in column:
+        if d is None:
+            out.append(None)
+        else:
+            value = d if value is None else value + d
+            out.append(value)
+    return out
+
+def cell_int(value):
+    """A count from a CSV cell or row dict; None for blank, missing or unparseable cells."""
+    if value is None or str(value).strip() == "":
+        return None
+    try:
+        return int(float(value))
+    except ValueError:
+        return None
+
+def store_append(store, timestamp, rows):
+    """Adds one run to the store. rows: [{"territory", "rel", <metrics>}]. Re-adding the last timestamp is a no-op."""
+    if store["timestamps"] and store["timestamps"][-1] >= timestamp:
+        return
+    n = len(store["timestamps"])
+    store["timestamps"].append(timestamp)
+    seen = set()
+    for row in rows:
+        rel = str(row["rel"])
+        seen.add(rel)
+        entry = store["territories"].setdefault(rel, {"name": row["territory"], "last": {}, **{m: [None] * n for m in METRICS}})
+        entry["name"] = row["territory"]
+        for m in METRICS:
+            value = cell_int(row.get(m))
+            if value is None:
+                entry[m].append(None)  # blank cell in an old CSV: missing, like an absent territory
+                continue
+            last = entry["last"].get(m)
+            entry[m].append(value if last is None else value - last)
+            entry["last"][m] = value
+    for rel, entry in store["territories"].items():
+        if rel not in seen:
+            for m in METRICS:
+                entry[m].append(None)
+
+def migrate_csv_histories():
+    """Builds a store from the per-territory CSVs in STATS_DIR (the pre-store history format)."""
+    histories = {}
+    names = {rel: row["territory"] for rel, row in load_latest_rows().items()}
+    for fname in os.listdir(STATS_DIR):
+        if not fname.endswith(".csv") or "_" not in fname:
+            continue
+        rel = fname[:-4].rsplit("_", 1)[1]
+        with open(os.path.join(STATS_DIR, fname), newline="", encoding="utf-8") as f:
+            histories[rel] = {row["timestamp"]: row for row in csv.DictReader(f) if row.get("timestamp")}
+        names.setdefault(rel, fname[:-4].rsplit("_", 1)[0].replace("_", " "))
+
+    store = new_store()
+    for timestamp in sorted({ts for h in histories.values() for ts in h}):
+        rows = [{"territory": names[rel], "rel": rel, **h[timestamp]} for rel, h in histories.items() if timestamp in h]
+        store_append(store, timestamp, rows)
+    print(f"✓ Migrated {len(histories)} territory CSV histories into the consolidated store.")
+    return store
+
+def publish_bundles(store, snap):
+    """Writes tdata/territory-bundle-<metric>.json: shared epoch-ms timestamps plus delta-encoded columns."""
+    stamps = [int(datetime.strptime(t, "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=timezone.utc).timestamp() * 1000) for t in store["timestamps"]]
+    for m in BUNDLE_METRICS:
+        bundle = {
+            "timestamps": stamps,
+            "names": {rel: e["name"] for rel, e in store["territories"].items()},
+            "series": {rel: e[m] for rel, e in store["territories"].items()},
+        }
+        snap.write_json(f"territory-bundle-{m}.json", bundle, separators=(",", ":"))
+
+def update_store(timestamp, rows, snap):
+    store = load_store()
+    if store is None:
+        store = migrate_csv_histories()
+    store_append(store, timestamp, rows)
+    save_store(store)
+    publish_bundles(store, snap)
+
+# ================= MAIN =================
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help='Number of Overpass queries in flight')
+    parser.add_argument('--batch', action='store_true', help='Pack many territories into each Overpass query')
+    parser.add_argument('--extract', type=str, default=None, help='Count from a local .osm/.osm.pbf extract instead of Overpass (needs cached boundaries)')
+    parser.add_argument('--full', action='store_true', help='Re-count every territory, even ones with no edits since their last count')
+    profiling.add_argument(parser)
+    args = parser.parse_args()
+
+    started = profiling.start(args.profile, "ts")
+    try:
+        run(args)
+    finally:
+        if started:
+            profiling.finish()
+
+
+def run(args):
+    with profiling.stage("admin"):
+        fetch_admin_json()
+        territories = load_owned_territories()
+
+    atomic_write_text(HTML_OUTPUT_PATH, HTML_TEMPLATE)
+    print(f"✓ HTML file created at {HTML_OUTPUT_PATH}.")
+
+    timestamp, done = load_journal()
+    if timestamp:
+        started = datetime.strptime(timestamp, "%Y-%m-%dT%H:%M:%SZ")
+        if (datetime.utcnow() - started).total_seconds() > JOURNAL_MAX_AGE:
+            print(f"Closing out stale run {timestamp} ({len(done)} territories)...")
+            finalize_run(territories, timestamp, done)
+            timestamp, done = None, {}
+        else:
+            print(f"Resuming run {timestamp}: {len(done)} territories already collected.")
+
+    if not timestamp:
+        timestamp = datetime.utcnow().isoformat(timespec="seconds") + "Z"
+        start_journal(timestamp)
+
+    def record(rel_id, name, stats):
+        row = {"territory": name, "rel": rel_id, **stats, "timestamp": timestamp}
+        journal_append(row)
+        done[rel_id] = row
+
+    todo = [t for t in territories if t["rel"] not in done]
+
+    if args.extract:
+        import extract_counter
+        print(f"Counting {len(todo)} territories from {args.extract}...")
+        with profiling.stage("extract"):
+            counted = extract_counter.count_extract(args.extract, GEOM_DIR)
+        for t in todo:
+            if str(t["rel"]) in counted:
+                record(t["rel"], *counted[str(t["rel"])])
+            else:
+                print(f"  ❌ No cached boundary for rel {t['rel']}")
+        with profiling.stage("finalize"):
+            finalize_run(territories, timestamp, done)
+        return
+
+    bbox_cache = load_bbox_cache()
+    if not args.full:
+        previous = load_latest_rows()
+        with profiling.stage("change_detection"):
+            todo, unchanged = split_touched(todo, bbox_cache, previous)
+        for t in unchanged:
+            prev = previous[str(t["rel"])]
+            record(t["rel"], prev["territory"], {k: int(prev[k]) for k in ["nodes", "ways", "relations", "areas", "total"]})
+        print(f"{len(unchanged)} territories unchanged since their last count, carried forward.")
+
+    print(f"Processing {len(todo)} territories with {args.workers} workers...")
+    collect = collect_batched if args.batch else collect_all
+    with profiling.stage("collect"):
+        results = collect(todo, args.workers, on_result=record)
+
+    for rel_id, bounds in _bbox_updates.items():
+        if bounds:
+            bbox_cache[rel_id] = {"bbox": bounds, "counted": timestamp}
+    save_bbox_cache(bbox_cache)
+
+    for rel_id, result in results.items():
+        if not isinstance(result, tuple):
+            print(f"  ❌ Failed rel {rel_id}: {result}")
+
+    # Written in the admin file's order so output is deterministic regardless of completion order
+    with profiling.stage("finalize"):
+        finalize_run(territories, timestamp, done)
+
+    with profiling.stage("boundaries"):
+        fetch_boundaries(territories)
+
+    try:
+        import territory_analytics
+    except ImportError as e:
+        print(f"Territory analytics skipped ({e}).")
+    else:
+        with profiling.stage("analytics"):
+            territory_analytics.run(STORE_FILE, RANKINGS_FILE)
 
 if __name__ == "__main__":
     main()